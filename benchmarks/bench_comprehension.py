@@ -0,0 +1,239 @@
+"""
+Comprehension benchmark
+
+Runs the full per-file analysis (the path process_input_files takes) on
+generated corpora from 1KB to 50MB against known word sets of increasing
+size, and records throughput, peak RSS and per-stage time as JSON:
+
+    hsk1          known: HSK1                unknown: everything else
+    hsk1-4        known: HSK1-4              unknown: HSK5-6 and Bands (the repo layout)
+    hsk1-6+bands  known: every word list     unknown: none
+
+Each case runs in a fresh process, with models and dictionaries loaded
+before timing starts, so peak RSS and timings are not shared between cases.
+Corpora are generated from a fixed seed and reused between runs.
+
+Run from the repository root:
+
+    python benchmarks/bench_comprehension.py --output before.json
+    python benchmarks/bench_comprehension.py --output after.json
+    python benchmarks/bench_comprehension.py --compare before.json after.json
+
+--compare flags any case whose throughput dropped, or whose peak RSS grew,
+by more than --threshold and exits with status 1 if there is one.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+WORK_DIR = os.path.join(REPO_DIR, '.cache', 'bench')
+SIZES = {'1KB': 1 << 10, '10KB': 10 << 10, '100KB': 100 << 10, '1MB': 1 << 20, '10MB': 10 << 20, '50MB': 50 << 20}
+LEVELS = {
+    'hsk1': ['HSK1'],
+    'hsk1-4': ['HSK1', 'HSK2', 'HSK3', 'HSK4'],
+    'hsk1-6+bands': ['HSK1', 'HSK2', 'HSK3', 'HSK4', 'HSK5', 'HSK6',
+                     'HSKBand1', 'HSKBand2', 'HSKBand3', 'HSKBand4', 'HSKBand5', 'HSKBand6'],
+}
+WORD_LIST_DIRS = ('known', 'unknown')
+REPEAT_MAX_BYTES = 1 << 20  # Larger corpora are timed once, smaller ones take the best of --repeat
+
+
+def word_lists() -> dict:
+    """Path of every word list in the repo, keyed by name (e.g. 'HSK5')"""
+    lists = {}
+    for directory in WORD_LIST_DIRS:
+        for txt_file in sorted(os.listdir(os.path.join(REPO_DIR, directory))):
+            if txt_file.endswith('.txt'):
+                lists[txt_file[:-4]] = os.path.join(REPO_DIR, directory, txt_file)
+    return lists
+
+
+def read_words(path: str) -> list:
+    with open(path, encoding='utf8') as f:
+        return [line.split('\t')[0].split('#')[0].strip() for line in f
+                if line.strip() and not line.startswith('#')]
+
+
+def make_corpus(path: str, size: int, seed: int = 0) -> None:
+    """Write about `size` bytes of sentences drawn from every word list.
+    
+    Words are drawn with Zipf-like weights in HSK order, so common HSK1 words
+    dominate as in real text and each level leaves a different share unknown.
+    """
+    lists = word_lists()
+    words = list(dict.fromkeys(w for name in LEVELS['hsk1-6+bands'] for w in read_words(lists[name])))
+    cum_weights, total = [], 0.0
+    for rank in range(len(words)):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+    
+    rng = random.Random(seed)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < size:
+            sentence = ''.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(6, 18)))
+            sentence += rng.choice('。。。，！？') + ('\n' if rng.random() < 0.1 else '')
+            f.write(sentence)
+            written += len(sentence.encode('utf-8'))
+
+
+def corpus_path(size_label: str) -> str:
+    path = os.path.join(WORK_DIR, 'corpus', f"{size_label}.txt")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        make_corpus(path + '.tmp', SIZES[size_label])
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def level_dir(level: str) -> str:
+    """Working directory whose known/ and unknown/ hold the word lists of a level"""
+    workspace = os.path.join(WORK_DIR, level)
+    if os.path.isdir(workspace):
+        shutil.rmtree(workspace)
+    lists = word_lists()
+    for directory in WORD_LIST_DIRS:
+        os.makedirs(os.path.join(workspace, directory))
+    for name, path in lists.items():
+        directory = 'known' if name in LEVELS[level] else 'unknown'
+        shutil.copy(path, os.path.join(workspace, directory))
+    for name in ('definitions.txt', 'definitions.idx'):
+        if os.path.exists(os.path.join(REPO_DIR, name)):
+            os.symlink(os.path.join(REPO_DIR, name), os.path.join(workspace, name))
+    return workspace
+
+
+def run_case(path: str, repeat: int) -> dict:
+    """Analyze one corpus in this process (run inside the level's workspace)"""
+    import script
+    
+    start = time.perf_counter()
+    script.warm_up()  # Without NER if the model is unavailable, as in a normal run
+    load_seconds = time.perf_counter() - start
+    
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        report = script.analyze_files([path])[0]
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, report)
+    seconds, report = best
+    
+    size = os.path.getsize(path)
+    return {
+        'bytes': size,
+        'chars': report.chars,
+        'load_seconds': round(load_seconds, 4),
+        'seconds': round(seconds, 4),
+        'bytes_per_sec': round(size / seconds),
+        'chars_per_sec': round(report.chars / seconds),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': report.profile.as_dict() if report.profile else {},
+        'error': 'Error:' in report.block,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(sizes, levels, repeat: int) -> dict:
+    results = []
+    print(f"{'size':>6} {'level':<14} {'seconds':>9} {'KB/s':>9} {'peak RSS':>10}")
+    for level in levels:
+        workspace = level_dir(level)
+        for size_label in sizes:
+            path = corpus_path(size_label)
+            case_repeat = repeat if SIZES[size_label] <= REPEAT_MAX_BYTES else 1
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), '--case', path, '--repeat', str(case_repeat)],
+                cwd=workspace, text=True)
+            result = {'size': size_label, 'level': level, **json.loads(output.splitlines()[-1])}
+            results.append(result)
+            print(f"{size_label:>6} {level:<14} {result['seconds']:>9.3f} "
+                  f"{result['bytes_per_sec'] / 1024:>9.0f} {result['peak_rss_mb']:>8.1f}MB")
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'results': results,
+    }
+
+
+def compare(baseline_path: str, current_path: str, threshold: float) -> int:
+    """Print both runs side by side and return the number of regressions"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['size'], r['level']): r for r in json.load(f)['results']}
+    with open(current_path, encoding='utf-8') as f:
+        current = json.load(f)['results']
+    
+    regressions = 0
+    print(f"{'size':>6} {'level':<14} {'KB/s before':>12} {'KB/s after':>11} {'change':>8} "
+          f"{'RSS before':>11} {'RSS after':>10}")
+    for result in current:
+        old = baseline.get((result['size'], result['level']))
+        if old is None:
+            continue
+        speed = result['bytes_per_sec'] / old['bytes_per_sec'] - 1
+        memory = result['peak_rss_mb'] / old['peak_rss_mb'] - 1
+        flags = []
+        if speed < -threshold:
+            flags.append('SLOWER')
+        if memory > threshold:
+            flags.append('MORE MEMORY')
+        regressions += bool(flags)
+        print(f"{result['size']:>6} {result['level']:<14} {old['bytes_per_sec'] / 1024:>12.0f} "
+              f"{result['bytes_per_sec'] / 1024:>11.0f} {speed:>+8.1%} {old['peak_rss_mb']:>9.1f}MB "
+              f"{result['peak_rss_mb']:>8.1f}MB  {' '.join(flags)}")
+    print(f"\n{regressions} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark comprehension analysis across text sizes and vocabulary levels.")
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=list(SIZES))
+    parser.add_argument('--levels', nargs='+', choices=LEVELS, default=list(LEVELS))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help=f"runs per case up to {REPEAT_MAX_BYTES >> 20}MB, best one kept (default: 3)")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="compare two result files and flag regressions")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative slowdown or memory growth flagged as a regression (default: 0.10)")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    if args.case:
+        print(json.dumps(run_case(args.case, args.repeat)))
+    elif args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    else:
+        report = run(args.sizes, args.levels, args.repeat)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Segmentation DP benchmark
+
+Times best_segmentation_path on generated texts of increasing length and
+prints the cost per character, which should stay flat as the text grows.
+Two corpora are measured: text made only of known words, and a worst case
+with no known words at all, where every position falls back to extending
+an unknown run.
+
+Run from the repository root: python benchmarks/bench_segmentation.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from script import best_segmentation_path, WordTrie, KNOWN_WORDS_DIR
+
+SIZES = [10_000, 25_000, 50_000, 100_000, 200_000]
+
+
+def load_known_words(known_words_dir: str = KNOWN_WORDS_DIR) -> set:
+    words = set()
+    for txt_file in sorted(os.listdir(known_words_dir)):
+        if txt_file.endswith('.txt'):
+            with open(os.path.join(known_words_dir, txt_file), encoding='utf8') as f:
+                words.update(f.read().split())
+    return words
+
+
+def make_text(words: list, size: int, seed: int = 0) -> str:
+    """Build a text of exactly `size` characters from random words"""
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        word = rng.choice(words)
+        parts.append(word)
+        length += len(word)
+    return ''.join(parts)[:size]
+
+
+def time_corpus(title: str, vocabulary: list, known_words: set, sizes) -> None:
+    known_trie = WordTrie(known_words)
+    print(f"\n{title}")
+    print(f"{'chars':>10} {'seconds':>10} {'us/char':>10}")
+    for size in sizes:
+        text = make_text(vocabulary, size)
+        start = time.perf_counter()
+        best_segmentation_path(text, known_trie)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>10} {elapsed:>10.3f} {elapsed / size * 1e6:>10.2f}")
+
+
+def run(sizes=SIZES) -> None:
+    known_words = load_known_words()
+    
+    # Words whose characters are all known on their own, so a known word ends
+    # at every position and the text measures only the DP transitions
+    vocabulary = sorted(w for w in known_words if all(c in known_words for c in w))
+    time_corpus("Known words only", vocabulary, known_words, sizes)
+    
+    # CJK ideographs that never appear in a known word
+    known_chars = set(''.join(known_words))
+    unknown_chars = [chr(cp) for cp in range(0x4E00, 0x9FA6) if chr(cp) not in known_chars]
+    time_corpus("Worst case: no known words", unknown_chars, known_words, sizes)
+
+
+if __name__ == "__main__":
+    run()
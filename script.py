@@ -5,22 +5,41 @@ Analyzes Chinese text from input files to calculate comprehension based on known
 Uses dynamic programming for optimal word segmentation.
 """
 
-import spacy_pkuseg as pkuseg
-import spacy
 import unicodedata
 from collections import Counter, namedtuple
-from pypinyin import pinyin, Style
-from typing import List, Set, Dict
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Iterable, List, Set, Dict, Optional, Tuple
+import argparse
+import codecs
+import contextlib
+import contextvars
+import hashlib
+import itertools
+import json
+import mmap
 import os
 import logging
+import re
+import socket
+import socketserver
+import sqlite3
+import struct
 import sys
+import threading
+import time
+import tracemalloc
+
+# spacy, spacy_pkuseg, pypinyin and numpy take seconds to import between them, so they
+# are imported where they are used; runs served from the cache never load them
+if TYPE_CHECKING:
+    import numpy as np
 
 # Configure logging - suppress all INFO messages
 logging.basicConfig(
     level=logging.ERROR,
     format='%(levelname)s - %(message)s',
     handlers=[
-        logging.StreamHandler(sys.stdout)
+        logging.StreamHandler(sys.stderr)  # Keeps stdout clean for reports and --format ndjson
     ]
 )
 logger = logging.getLogger(__name__)
@@ -28,12 +47,33 @@ logger = logging.getLogger(__name__)
 logging.getLogger().setLevel(logging.ERROR)
 
 # Constants
-MAX_WORD_LENGTH = 4
+MAX_WORD_LENGTH = 4  # Longest dictionary word considered (None = no limit, the trie bounds the walk)
 KNOWN_WORDS_DIR = "known"
 UNKNOWN_WORDS_DIR = "unknown"
 INPUT_DIR = "input"
 MAX_UNKNOWN_WORDS_DISPLAY = 20
 CEDICT_PATH = "definitions.txt"  # Path to CC-CEDICT dictionary file
+CEDICT_INDEX_SUFFIX = ".idx"  # Compiled binary index written next to the dictionary file
+SNAPSHOT_PATH = "models.snapshot"  # Pre-baked models and dictionary (see --build-snapshot)
+DAEMON_SOCKET = "/tmp/chinese-checker.sock"  # Unix socket used by --serve and --client
+SPACY_MODEL = "zh_core_web_sm"
+NER_LABELS = {'PERSON', 'GPE', 'ORG', 'FAC', 'LOC'}  # Entity types treated as proper nouns
+NER_UNUSED_COMPONENTS = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'senter', 'morphologizer']
+NER_BATCH_SIZE = 64  # Texts per nlp.pipe batch
+NER_N_PROCESS = 1  # Processes used by nlp.pipe
+NER_MAX_CHUNK_CHARS = 2000  # Longest piece of text handed to spaCy at once
+CACHE_PATH = ".cache/results.sqlite"  # On-disk cache of analysis results
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used results are evicted beyond this size
+CACHE_MAX_AGE_DAYS = 30  # Results not used for this long are evicted
+CACHE_SCHEMA_VERSION = 4  # Bump when the cached payload or analysis logic changes
+LIBRARY_PATH = ".cache/library.sqlite"  # Index of analyzed documents used for incremental re-scoring
+RANKING_PATH = ".cache/ranking.npz"  # Word-count vectors of the library used by --recommend
+OPTIMAL_BAND = (89.0, 92.0)  # Comprehension range assessed as 🟢 Optimal (i+1)
+STREAM_THRESHOLD_BYTES = 32 * 1024 * 1024  # Larger input files are analyzed in streaming chunks
+STREAM_CHUNK_CHARS = 256 * 1024  # Characters read per streaming chunk
+STREAM_OVERLAP_CHARS = 64  # Tail of each chunk re-segmented with the next so words aren't split
+STREAM_PROGRESS_INTERVAL = 0.5  # Seconds between running progress lines when streaming
+STARTUP_TRACE_TOP = 15  # Packages listed by --startup-trace
 
 # Initialize pkuseg segmenter (only once for efficiency)
 # pkuseg provides superior accuracy (96.88% F1 on MSRA) from Peking University
@@ -49,21 +89,39 @@ def get_pkuseg_segmenter():
     if pkuseg_segmenter is None:
         # Use 'mixed' model for best general-purpose accuracy
         # Other options: 'news', 'web', 'medicine', 'tourism'
-        pkuseg_segmenter = pkuseg.pkuseg(model_name='mixed')
+        snapshot = get_model_snapshot()
+        if snapshot is not None:
+            pkuseg_segmenter = snapshot.load('pkuseg')
+        if pkuseg_segmenter is None:
+            import spacy_pkuseg as pkuseg
+            pkuseg_segmenter = pkuseg.pkuseg(model_name='mixed')
     return pkuseg_segmenter
 
+def load_ner_pipeline(model: str = SPACY_MODEL):
+    """Load a spaCy pipeline with only the components NER needs"""
+    import spacy
+    nlp = spacy.load(model, exclude=NER_UNUSED_COMPONENTS)
+    if 'tok2vec' in nlp.pipe_names and 'ner' not in nlp.get_pipe('tok2vec').listening_components:
+        # NER has its own embedding layer, so the shared one is dead weight
+        nlp.disable_pipe('tok2vec')
+    return nlp
+
 def get_spacy_nlp():
     """Lazy load spaCy NER model to avoid slow startup"""
     global spacy_nlp
+    if spacy_nlp is None:
+        snapshot = get_model_snapshot()
+        if snapshot is not None:
+            spacy_nlp = snapshot.load('ner')
     if spacy_nlp is None:
         try:
-            spacy_nlp = spacy.load("zh_core_web_sm")
+            spacy_nlp = load_ner_pipeline()
         except OSError:
-            logger.warning("spaCy Chinese model not found. Downloading zh_core_web_sm (~50MB)...")
+            logger.warning(f"spaCy Chinese model not found. Downloading {SPACY_MODEL} (~50MB)...")
             try:
                 import subprocess
-                subprocess.check_call([sys.executable, "-m", "spacy", "download", "zh_core_web_sm"])
-                spacy_nlp = spacy.load("zh_core_web_sm")
+                subprocess.check_call([sys.executable, "-m", "spacy", "download", SPACY_MODEL])
+                spacy_nlp = load_ner_pipeline()
             except Exception as e:
                 logger.error(f"Failed to download spaCy model: {e}")
                 raise RuntimeError(f"Could not download spaCy Chinese model: {e}")
@@ -75,20 +133,148 @@ PUNCTUATION_CHARS = set(
     '｟｠｢｣､、〃《》「」『』【】〔〕〖〗〘〙〚〛〜〝〞〟〰〾〿–—''‛""„‟…‧﹏.?;﹔|.-·-*─\'\'\"\""'
 )
 
-# Named tuple for DP state
-DPState = namedtuple('DPState', ['score', 'segmentation', 'unknown_start'])
+# Named tuple for the loaded known/unknown word lists
+Vocabulary = namedtuple('Vocabulary', ['known_words', 'unknown_words', 'known_trie', 'unknown_matcher', 'fingerprint'])
+
+# Named tuple for the outcome of analyzing one text; `dropped` counts the tokens
+# not counted as words by reason (see WORD_FILTER_REASONS), None in older results
+AnalysisResult = namedtuple('AnalysisResult', [
+    'segmentation', 'proper_nouns', 'total_words', 'unique_words',
+    'known_count', 'comprehension_pct', 'assessment', 'unknown_words', 'dropped', 'counters',
+    'pinyin',
+], defaults=(None, None, None))
+SEGMENTER_COUNTERS = ('unknown_spans', 'pkuseg_calls')  # Segmentation work reported with each analysis
+
+# Per-codepoint classes for word filtering: punctuation -> 'P', ASCII letters and digits -> 'A'
+WORD_CLASS_TABLE = str.maketrans({
+    **{c: 'P' for c in PUNCTUATION_CHARS},
+    **{chr(cp): 'A' for cp in range(128) if chr(cp).isalnum()},
+})
+WORD_FILTER_REASONS = ('empty', 'digit', 'punctuation', 'ascii', 'proper_noun')
+
+# Named tuple for one analyzed input file: printable report block, characters read,
+# whether the result came from the cache (None if the cache was not consulted),
+# and the StageProfile of its analysis (None if it was not analyzed here)
+FileReport = namedtuple('FileReport', ['block', 'chars', 'cached', 'profile'])
+
+# Report formats: human-readable text, or one JSON record per file
+OUTPUT_FORMATS = ('text', 'ndjson')
+
+# Named tuple for result cache statistics
+CacheStats = namedtuple('CacheStats', ['hits', 'misses', 'entries', 'bytes'])
+
+# Named tuple for NER batching settings
+NerOptions = namedtuple('NerOptions', ['batch_size', 'n_process', 'max_chunk_chars'])
+DEFAULT_NER_OPTIONS = NerOptions(NER_BATCH_SIZE, NER_N_PROCESS, NER_MAX_CHUNK_CHARS)
+
+# One line of `python -X importtime` output: self and cumulative microseconds, indented module name
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+# Text made only of CJK Unified Ideographs (and Extension A), which NFKD leaves unchanged
+CJK_ONLY_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]*')
+CJK_RUN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]+')
+
+# Sentence-final punctuation (after NFKD normalization ！？； become !?;)
+SENTENCE_END_RE = re.compile(r'[。！？!?；;…]+')
+
+# Named tuple for dictionary service statistics
+CedictStats = namedtuple('CedictStats', ['load_time', 'entry_count', 'memory_bytes', 'loads'])
+
+# Named tuple for the cost of one analysis stage: wall time, times run, and bytes
+# allocated (peak traced memory above the start, 0 unless tracemalloc is tracing)
+StageStats = namedtuple('StageStats', ['seconds', 'calls', 'bytes'])
+
+# Profile that profile_stage() records into in the current thread, if any
+active_profile = contextvars.ContextVar('active_profile', default=None)
+
+# Open stages as [traced memory at start, peak seen]; tracemalloc's peak is process-wide
+traced_stages: List[List[int]] = []
+
+
+class StageProfile:
+    """Wall time, call counts and allocated bytes per analysis stage.
+    
+    Hot paths mark their stages with `with profile_stage('dp'):`, which is
+    recorded into the profile activated by `with profiling(profile):` and
+    does nothing otherwise. Stages may nest ('pinyin' runs inside 'format'),
+    so their times can add up to more than the total.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {}
+
+    def add(self, stage: str, seconds: float, calls: int = 1, nbytes: int = 0) -> None:
+        old = self.stages.get(stage, StageStats(0.0, 0, 0))
+        self.stages[stage] = StageStats(old.seconds + seconds, old.calls + calls, old.bytes + nbytes)
+
+    def merge(self, other: 'StageProfile') -> None:
+        for stage, stats in other.stages.items():
+            self.add(stage, *stats)
+
+    def share(self, fraction: float) -> 'StageProfile':
+        """The part of this profile attributable to one of several texts processed together"""
+        profile = StageProfile()
+        for stage, stats in self.stages.items():
+            profile.add(stage, stats.seconds * fraction, stats.calls, int(stats.bytes * fraction))
+        return profile
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if traced_stages:
+                traced_stages[-1][1] = max(traced_stages[-1][1], peak)
+            tracemalloc.reset_peak()
+            traced_stages.append([current, current])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            nbytes = 0
+            if tracing:
+                frame = traced_stages.pop()
+                frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+                nbytes = frame[1] - frame[0]
+                if traced_stages:
+                    traced_stages[-1][1] = max(traced_stages[-1][1], frame[1])
+            self.add(name, seconds, 1, nbytes)
+
+    def as_dict(self) -> Dict[str, dict]:
+        return {
+            stage: {'seconds': round(stats.seconds, 6), 'calls': stats.calls, 'bytes': stats.bytes}
+            for stage, stats in self.stages.items()
+        }
+
+
+@contextlib.contextmanager
+def profiling(profile: Optional[StageProfile]):
+    """Record stages run inside the block into profile (if not None)"""
+    if profile is None:
+        yield
+        return
+    token = active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        active_profile.reset(token)
+
 
+def profile_stage(name: str):
+    """Context manager timing a stage into the active profile, if there is one"""
+    profile = active_profile.get()
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.stage(name)
 
-def load_cedict(path: str) -> Dict[str, str]:
-    """Load CC-CEDICT dictionary into memory for instant lookups.
+
+def parse_cedict(path: str) -> Dict[str, str]:
+    """Parse the CC-CEDICT text file into a Python dictionary.
     
     Returns a dictionary mapping Chinese words to their English definitions.
     """
     cedict = {}
-    if not os.path.exists(path):
-        logger.warning(f"CC-CEDICT not found, definitions unavailable")
-        return cedict
-    
     try:
         with open(path, 'r', encoding='utf-8') as f:
             for line in f:
@@ -128,205 +314,929 @@ def load_cedict(path: str) -> Dict[str, str]:
     return cedict
 
 
-def comprehension_checker(text: str, known_words_dir: str = KNOWN_WORDS_DIR) -> str:
-    """Check comprehension of Chinese text against known words.
-    Automatically excludes proper nouns (names, places) for accurate comprehension measurement.
+# Binary index layout (all integers little-endian uint32):
+#   header:  magic, version, sha256 of the source file, entry count
+#   offsets: (count + 1) key offsets, then (count + 1) value offsets
+#   blobs:   UTF-8 keys sorted bytewise, then UTF-8 values in the same order
+CEDICT_INDEX_MAGIC = b'CEDX'
+CEDICT_INDEX_VERSION = 1
+CEDICT_INDEX_HEADER = struct.Struct('<4sI32sI')
+
+
+def cedict_index_path(path: str) -> str:
+    """Return the location of the compiled index for a CC-CEDICT file"""
+    return os.path.splitext(path)[0] + CEDICT_INDEX_SUFFIX
+
+
+def file_digest(path: str) -> bytes:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def compile_cedict(path: str, index_path: Optional[str] = None) -> str:
+    """Compile CC-CEDICT into a compact sorted binary index that can be mmapped.
     
-    Args:
-        text: The Chinese text to analyze
-        known_words_dir: Directory containing known words files
+    Returns the path of the written index.
+    """
+    index_path = index_path or cedict_index_path(path)
+    digest = file_digest(path)
+    entries = sorted(
+        (word.encode('utf-8'), definition.encode('utf-8'))
+        for word, definition in parse_cedict(path).items()
+    )
     
-    Returns:
-        Analysis report as a string
+    key_offsets, value_offsets = [0], [0]
+    for key, value in entries:
+        key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets.append(value_offsets[-1] + len(value))
+    
+    # Write to a temporary file first so readers never see a partial index
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(CEDICT_INDEX_HEADER.pack(CEDICT_INDEX_MAGIC, CEDICT_INDEX_VERSION, digest, len(entries)))
+        f.write(struct.pack(f'<{len(key_offsets)}I', *key_offsets))
+        f.write(struct.pack(f'<{len(value_offsets)}I', *value_offsets))
+        f.write(b''.join(key for key, _ in entries))
+        f.write(b''.join(value for _, value in entries))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+class CedictIndex(Mapping):
+    """Read-only CC-CEDICT mapping backed by a memory-mapped binary index.
+    
+    Opening costs almost nothing and the pages are shared by every process
+    that maps the same file. Lookups binary search the sorted key block.
     """
-    try:
-        # Load CC-CEDICT dictionary for instant offline lookups
-        cedict = load_cedict(CEDICT_PATH)
+
+    def __init__(self, index_path: str, offset: int = 0, length: int = 0):
+        # A non-zero offset maps an index embedded in a larger file, such as a model snapshot
+        with open(index_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=offset)
+        magic, version, self.digest, self._count = CEDICT_INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != CEDICT_INDEX_MAGIC or version != CEDICT_INDEX_VERSION:
+            self._mm.close()
+            raise ValueError(f"Not a CC-CEDICT index: '{index_path}'")
         
-        # Load known words from all .txt files in known directory
-        base_words = set()
-        if os.path.exists(known_words_dir) and os.path.isdir(known_words_dir):
-            txt_files = [f for f in os.listdir(known_words_dir) if f.endswith('.txt')]
-            for txt_file in txt_files:
-                file_path = os.path.join(known_words_dir, txt_file)
-                with open(file_path, encoding="utf8") as f:
-                    base_words.update(f.read().split())
+        offsets_start = CEDICT_INDEX_HEADER.size
+        offsets_size = (self._count + 1) * 4
+        view = memoryview(self._mm)
+        self._key_offsets = view[offsets_start:offsets_start + offsets_size].cast('I')
+        self._value_offsets = view[offsets_start + offsets_size:offsets_start + 2 * offsets_size].cast('I')
+        self._keys_start = offsets_start + 2 * offsets_size
+        self._values_start = self._keys_start + self._key_offsets[self._count]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mm)
+
+    def _key(self, idx: int) -> bytes:
+        start = self._keys_start
+        return self._mm[start + self._key_offsets[idx]:start + self._key_offsets[idx + 1]]
+
+    def _find(self, word) -> int:
+        if not isinstance(word, str):
+            return -1
+        key = word.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key(lo) == key:
+            return lo
+        return -1
+
+    def __contains__(self, word) -> bool:
+        return self._find(word) != -1
+
+    def __getitem__(self, word: str) -> str:
+        idx = self._find(word)
+        if idx == -1:
+            raise KeyError(word)
+        start = self._values_start
+        return self._mm[start + self._value_offsets[idx]:start + self._value_offsets[idx + 1]].decode('utf-8')
+
+    def __iter__(self):
+        for idx in range(self._count):
+            yield self._key(idx).decode('utf-8')
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def load_cedict(path: str) -> Mapping:
+    """Load CC-CEDICT for instant lookups.
+    
+    Uses the compiled binary index next to the dictionary file, rebuilding it
+    when the source file's hash changes. Falls back to parsing the text file
+    into memory if the index cannot be written.
+    
+    Returns a mapping of Chinese words to their English definitions.
+    """
+    if not os.path.exists(path):
+        logger.warning(f"CC-CEDICT not found, definitions unavailable")
+        return {}
+    
+    index_path = cedict_index_path(path)
+    try:
+        digest = file_digest(path)
+        snapshot = get_model_snapshot()
+        if snapshot is not None:
+            index = snapshot.load('cedict')
+            if index is not None and index.digest == digest:
+                return index
+        try:
+            index = CedictIndex(index_path)
+            if index.digest == digest:
+                return index
+        except (OSError, ValueError):
+            pass
+        compile_cedict(path, index_path)
+        return CedictIndex(index_path)
+    except Exception as e:
+        logger.warning(f"CC-CEDICT index unavailable ({e}), parsing text file instead")
+        return parse_cedict(path)
+
+
+class CedictService:
+    """Process-wide CC-CEDICT cache shared by every analysis.
+
+    The dictionary is parsed on first use and kept in memory. It is only
+    reloaded when the file's mtime changes, so batch runs pay the parsing
+    cost once per process instead of once per analyzed file.
+    """
+
+    def __init__(self, path: str = CEDICT_PATH):
+        self.path = path
+        self._cedict: Mapping = {}
+        self._mtime = None
+        self._loaded = False
+        self._load_time = 0.0
+        self._loads = 0
+        self._lock = threading.Lock()
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self) -> Mapping:
+        """Return the dictionary, (re)loading it if the file has changed"""
+        mtime = self._current_mtime()
+        if self._loaded and mtime == self._mtime:
+            return self._cedict
+        with self._lock:
+            if not self._loaded or mtime != self._mtime:
+                start = time.perf_counter()
+                with profile_stage('cedict'):
+                    self._cedict = load_cedict(self.path)
+                self._load_time = time.perf_counter() - start
+                self._mtime = mtime
+                self._loaded = True
+                self._loads += 1
+        return self._cedict
+
+    def stats(self) -> CedictStats:
+        """Return load time (seconds), entry count and approximate memory used (bytes)"""
+        cedict = self._cedict
+        if isinstance(cedict, CedictIndex):
+            # Mapped pages are shared between processes and paged in on demand
+            memory = cedict.nbytes
         else:
-            raise FileNotFoundError(f"Known words directory not found: '{known_words_dir}'")
-        
-        known_words = base_words.copy()
-        
-        # Load unknown words from all .txt files in unknown directory
-        unknown_words_list = set()
-        if os.path.exists(UNKNOWN_WORDS_DIR) and os.path.isdir(UNKNOWN_WORDS_DIR):
-            txt_files = [f for f in os.listdir(UNKNOWN_WORDS_DIR) if f.endswith('.txt')]
-            for txt_file in txt_files:
-                file_path = os.path.join(UNKNOWN_WORDS_DIR, txt_file)
-                with open(file_path, encoding="utf8") as f:
-                    for line in f:
-                        # Skip comments and empty lines
-                        line = line.strip()
-                        if line and not line.startswith('#'):
-                            # Extract word (before any tab or comment)
-                            word = line.split('\t')[0].split('#')[0].strip()
-                            if word:
-                                unknown_words_list.add(word)
-        
-        if not text:
-            raise ValueError("No text provided")
-        
-        # Clean up: remove whitespace and diacritics
-        normalized = unicodedata.normalize("NFKD", "".join(text.split()))
-        cleaned = "".join(c for c in normalized if unicodedata.category(c) != "Mn")
+            memory = sys.getsizeof(cedict) + sum(
+                sys.getsizeof(k) + sys.getsizeof(v) for k, v in cedict.items()
+            )
+        return CedictStats(self._load_time, len(cedict), memory, self._loads)
+
+
+# Shared dictionary service (only one per process)
+cedict_service = None
+
+def get_cedict_service() -> CedictService:
+    """Lazy create the shared CC-CEDICT service"""
+    global cedict_service
+    if cedict_service is None:
+        cedict_service = CedictService(CEDICT_PATH)
+    return cedict_service
+
+
+SNAPSHOT_MAGIC = b'CCSN'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sIQI')  # magic, version, table of contents offset and length
+
+
+def build_snapshot(path: str = SNAPSHOT_PATH, cedict_path: str = CEDICT_PATH) -> str:
+    """Bake the pkuseg model, trimmed NER pipeline and compiled CC-CEDICT into one file.
+    
+    Meant to run once at image build time. Each section starts on an mmap
+    allocation boundary, so the dictionary index is mapped straight out of
+    the snapshot; the models are deserialized from their sections instead of
+    being loaded and set up from their packages. Returns the path written.
+    """
+    import pickle
+    index_path = f"{path}.{os.getpid()}.idx"
+    compile_cedict(cedict_path, index_path)
+    try:
+        with open(index_path, 'rb') as f:
+            cedict_bytes = f.read()
+    finally:
+        os.remove(index_path)
+    nlp = load_ner_pipeline()
+    sections = {
+        'cedict': cedict_bytes,
+        'pkuseg': pickle.dumps(get_pkuseg_segmenter(), protocol=pickle.HIGHEST_PROTOCOL),
+        'ner': nlp.to_bytes(),
+    }
+    toc = {'versions': model_versions(), 'ner_config': nlp.config.to_str(), 'sections': {}}
+    
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, 0))
+        for name, data in sections.items():
+            f.write(b'\0' * (-f.tell() % mmap.ALLOCATIONGRANULARITY))
+            offset = f.tell()
+            f.write(data)
+            toc['sections'][name] = [offset, len(data)]
+        toc_bytes = json.dumps(toc).encode('utf-8')
+        toc_offset = f.tell()
+        f.write(toc_bytes)
+        f.seek(0)
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, toc_offset, len(toc_bytes)))
+    os.replace(tmp_path, path)
+    return path
+
+
+class ModelSnapshot:
+    """Read side of a snapshot written by build_snapshot"""
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(SNAPSHOT_HEADER.size)
+            if len(header) < SNAPSHOT_HEADER.size:
+                raise ValueError(f"Not a model snapshot: '{path}'")
+            magic, version, toc_offset, toc_length = SNAPSHOT_HEADER.unpack(header)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f"Not a model snapshot: '{path}'")
+            f.seek(toc_offset)
+            self.toc = json.loads(f.read(toc_length))
+
+    def _read(self, name: str) -> bytes:
+        offset, length = self.toc['sections'][name]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def load(self, name: str):
+        """Load one section ('cedict', 'pkuseg' or 'ner'), or None if that fails"""
+        try:
+            if name == 'cedict':
+                return CedictIndex(self.path, *self.toc['sections']['cedict'])
+            if name == 'pkuseg':
+                import pickle
+                return pickle.loads(self._read('pkuseg'))
+            if name == 'ner':
+                import spacy
+                from thinc.api import Config
+                config = Config().from_str(self.toc['ner_config'])
+                nlp = spacy.util.get_lang_class(config['nlp']['lang']).from_config(config)
+                return nlp.from_bytes(self._read('ner'))
+            raise KeyError(name)
+        except Exception as e:
+            logger.warning(f"Could not load '{name}' from model snapshot: {e}")
+            return None
+
+
+# Pre-baked model snapshot, False once it is known there is no usable one
+model_snapshot = None
+
+def get_model_snapshot() -> Optional[ModelSnapshot]:
+    """Lazy open the model snapshot, if one was built for the installed package versions"""
+    global model_snapshot
+    if model_snapshot is None:
+        model_snapshot = False
+        if os.path.exists(SNAPSHOT_PATH):
+            try:
+                snapshot = ModelSnapshot(SNAPSHOT_PATH)
+                if snapshot.toc['versions'] == model_versions():
+                    model_snapshot = snapshot
+                else:
+                    logger.warning("Model snapshot was built for other package versions, ignoring it")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Model snapshot unusable: {e}")
+    return model_snapshot or None
+
+
+class WordTrie:
+    """Prefix trie over a word list.
+    
+    Lists every word that starts at a position of a text in a single walk,
+    without building a substring for each candidate length.
+    """
+
+    _END = ''  # Marks the end of a word; never a character of the text
+
+    def __init__(self, words=()):
+        self.root: Dict[str, dict] = {}
+        self.max_length = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        node = self.root
+        for c in word:
+            node = node.setdefault(c, {})
+        node[self._END] = True
+        self.max_length = max(self.max_length, len(word))
+
+    def __contains__(self, word: str) -> bool:
+        node = self.root
+        for c in word:
+            node = node.get(c)
+            if node is None:
+                return False
+        return self._END in node
+
+    def match_ends(self, text: str, start: int, max_length: Optional[int] = MAX_WORD_LENGTH) -> List[int]:
+        """End positions of every word starting at text[start], shortest first"""
+        limit = len(text) if max_length is None else min(len(text), start + max_length)
+        ends = []
+        node = self.root
+        for k in range(start, limit):
+            node = node.get(text[k])
+            if node is None:
+                break
+            if self._END in node:
+                ends.append(k + 1)
+        return ends
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton that finds every dictionary word in a text in one pass"""
+
+    def __init__(self, words=()):
+        # State 0 is the root. Each state has goto transitions, a failure link
+        # and the lengths of the words that end there, including via failure links.
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
         
-        if not cleaned:
-            return "Error: No Chinese text found after filtering"
+        for word in words:
+            state = 0
+            for c in word:
+                nxt = self._goto[state].get(c)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][c] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            if word and len(word) not in self._out[state]:
+                self._out[state] += (len(word),)
         
-        # DP tokenization to maximize known word coverage
-        n = len(cleaned)
-        dp: List[DPState] = [DPState(0, [], -1)] + [DPState(float('-inf'), [], -1)] * n
+        # Breadth-first pass so a state's failure link is complete before its children's
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for c, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(c, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def iter_matches(self, text: str):
+        """Yield (start, end) for every dictionary word occurring in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for pos, c in enumerate(text):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for length in out[state]:
+                yield pos + 1 - length, pos + 1
+
+    def longest_at(self, text: str, max_length: Optional[int] = MAX_WORD_LENGTH) -> List[int]:
+        """Length of the longest dictionary word starting at each position of text (0 = none)"""
+        longest = [0] * len(text)
+        for start, end in self.iter_matches(text):
+            length = end - start
+            if length > longest[start] and (max_length is None or length <= max_length):
+                longest[start] = length
+        return longest
+
+
+def read_unknown_words(file_path: str) -> Set[str]:
+    """Read an unknown words file, skipping comments and pinyin annotations"""
+    words = set()
+    with open(file_path, encoding="utf8") as f:
+        for line in f:
+            # Skip comments and empty lines
+            line = line.strip()
+            if line and not line.startswith('#'):
+                # Extract word (before any tab or comment)
+                word = line.split('\t')[0].split('#')[0].strip()
+                if word:
+                    words.add(word)
+    return words
+
+
+def word_list_files(directory: str) -> List[str]:
+    """Paths of the .txt word lists in a directory"""
+    return [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.txt')]
+
+
+# Loaded vocabularies keyed by (known dir, unknown dir), with the file signature they were built from
+vocabulary_cache: Dict[Tuple[str, str], Tuple[tuple, Vocabulary]] = {}
+vocabulary_lock = threading.Lock()
+
+def load_vocabulary(known_words_dir: str = KNOWN_WORDS_DIR,
+                    unknown_words_dir: str = UNKNOWN_WORDS_DIR) -> Vocabulary:
+    """Load known and unknown word lists and build their tries.
+    
+    The result is cached per process and rebuilt only when a word list file
+    is added, removed or modified.
+    """
+    if not os.path.isdir(known_words_dir):
+        raise FileNotFoundError(f"Known words directory not found: '{known_words_dir}'")
+    
+    known_files = word_list_files(known_words_dir)
+    unknown_files = word_list_files(unknown_words_dir) if os.path.isdir(unknown_words_dir) else []
+    signature = tuple(
+        (path, st.st_mtime_ns, st.st_size)
+        for path, st in ((path, os.stat(path)) for path in sorted(known_files + unknown_files))
+    )
+    
+    key = (known_words_dir, unknown_words_dir)
+    with vocabulary_lock:
+        cached = vocabulary_cache.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
         
-        # Helper function to segment unknown text
-        def segment_unknown(text: str) -> List[str]:
-            """Segment unknown text by first checking unknown.txt, then using pkuseg"""
-            result = []
-            i = 0
-            segmenter = get_pkuseg_segmenter()
+        with profile_stage('vocabulary'):
+            known_words = set()
+            for file_path in known_files:
+                with open(file_path, encoding="utf8") as f:
+                    known_words.update(f.read().split())
             
-            while i < len(text):
-                # Try to match against unknown_words_list (longest match first)
-                matched = False
-                for length in range(min(MAX_WORD_LENGTH, len(text) - i), 0, -1):
-                    candidate = text[i:i+length]
-                    if candidate in unknown_words_list:
-                        result.append(candidate)
-                        i += length
-                        matched = True
-                        break
-                
-                if not matched:
-                    # If no match in unknown.txt, use pkuseg for this segment
-                    # Find the next unknown word boundary or end of text
-                    j = i + 1
-                    while j < len(text):
-                        found_unknown = False
-                        for length in range(min(MAX_WORD_LENGTH, len(text) - j), 0, -1):
-                            if text[j:j+length] in unknown_words_list:
-                                found_unknown = True
-                                break
-                        if found_unknown:
-                            break
-                        j += 1
-                    
-                    # Use pkuseg on this segment
-                    # pkuseg.cut() returns a list of word strings
-                    result.extend(segmenter.cut(text[i:j]))
-                    i = j
+            unknown_words = set()
+            for file_path in unknown_files:
+                unknown_words.update(read_unknown_words(file_path))
             
-            return result
+            vocabulary = build_vocabulary(known_words, unknown_words)
+        vocabulary_cache[key] = (signature, vocabulary)
+        return vocabulary
+
+
+def build_vocabulary(known_words: Set[str], unknown_words: Set[str]) -> Vocabulary:
+    """Build the matchers and fingerprint for a pair of word sets"""
+    fingerprint = hashlib.sha256(
+        '\n'.join(sorted(known_words)).encode('utf-8') + b'\0' +
+        '\n'.join(sorted(unknown_words)).encode('utf-8')
+    ).hexdigest()
+    return Vocabulary(known_words, unknown_words, WordTrie(known_words),
+                      AhoCorasick(unknown_words), fingerprint)
+
+
+def segment_unknown(text: str, unknown_matcher: AhoCorasick, counters: Optional[Counter] = None,
+                    splits: Optional[Dict[str, List[str]]] = None) -> List[str]:
+    """Segment unknown text by first checking unknown.txt, then using pkuseg
+    
+    A single Aho-Corasick pass finds every unknown-list word in the text up
+    front. Greedy longest matches and the pkuseg gaps between them are then
+    consumed in linear time.
+    
+    If `counters` is given, each pkuseg call is counted under 'pkuseg_calls'.
+    If `splits` is given, pkuseg results are looked up there first and new
+    ones are added to it, so they can be cached across analyses.
+    """
+    result = []
+    segmenter = None
+    longest = unknown_matcher.longest_at(text)
+    n = len(text)
+    i = 0
+    
+    while i < n:
+        # Take the longest unknown-list word starting here
+        if longest[i]:
+            result.append(text[i:i + longest[i]])
+            i += longest[i]
+            continue
         
-        for i in range(1, n + 1):
-            for j in range(max(0, i - MAX_WORD_LENGTH), i):
-                word = cleaned[j:i]
-                
-                if word in known_words:
-                    prev = dp[j]
-                    new_seg = prev.segmentation.copy()
-                    
-                    if prev.unknown_start != -1:
-                        new_seg.extend([(w, False) for w in segment_unknown(cleaned[prev.unknown_start:j])])
-                    
-                    new_seg.append((word, True))
-                    new_score = prev.score + len(word)
-                    
-                    if new_score > dp[i].score:
-                        dp[i] = DPState(new_score, new_seg, -1)
-            
-            if dp[i].score == float('-inf'):
-                best_prev = max(range(i), key=lambda x: dp[x].score)
-                prev = dp[best_prev]
-                unknown_start = best_prev if prev.unknown_start == -1 else prev.unknown_start
-                dp[i] = DPState(prev.score, prev.segmentation.copy(), unknown_start)
+        # Otherwise use pkuseg up to the next unknown word boundary or end of text
+        j = i + 1
+        while j < n and not longest[j]:
+            j += 1
         
-        final = dp[n]
-        result = final.segmentation.copy()
+        gap = text[i:j]
+        if splits is not None and gap in splits:
+            result.extend(splits[gap])
+            i = j
+            continue
         
-        if final.unknown_start != -1:
-            result.extend([(w, False) for w in segment_unknown(cleaned[final.unknown_start:n])])
+        # pkuseg.cut() returns a list of word strings
+        with profile_stage('pkuseg'):
+            if segmenter is None:
+                segmenter = get_pkuseg_segmenter()
+            words = segmenter.cut(gap)
+        result.extend(words)
+        if splits is not None:
+            splits[gap] = list(words)
+        if counters is not None:
+            counters['pkuseg_calls'] += 1
+        i = j
+    
+    return result
+
+
+def best_segmentation_path(cleaned: str, known_trie: WordTrie) -> List[Tuple[int, int, bool]]:
+    """Find the segmentation that maximizes known word coverage.
+    
+    Each position only keeps its score, a backpointer and the start of the
+    unknown run it belongs to, and a running maximum stands in for scanning
+    every earlier position when no known word ends, so time and memory stay
+    linear in the text length. The path is reconstructed once at the end.
+    
+    Returns (start, end, is_known) spans in text order. Unknown spans cover
+    whole runs of text that still need to be split into words.
+    """
+    n = len(cleaned)
+    # score[i]: most known characters covered in cleaned[:i] (-1 = not reached by a known word)
+    # back[i]: start of the known word ending at i, or the position an unknown run extends from
+    # unknown_start[i]: start of the unknown run ending at i (-1 if a known word ends at i)
+    score = [0] + [-1] * n
+    back = [0] * (n + 1)
+    unknown_start = [-1] * (n + 1)
+    # Earliest position with the highest score so far, used when no known word ends at i
+    best_prev = 0
+    
+    for i in range(n + 1):
+        # Every word ending at i has been offered by now, so its state is final
+        if i > 0:
+            if score[i] == -1:
+                score[i] = score[best_prev]
+                back[i] = best_prev
+                unknown_start[i] = best_prev if unknown_start[best_prev] == -1 else unknown_start[best_prev]
+            elif score[i] > score[best_prev]:
+                best_prev = i
         
-        # Detect proper nouns using spaCy NER
-        proper_nouns = set()
-        try:
+        # Offer every known word starting at i; earlier starts win ties
+        for end in known_trie.match_ends(cleaned, i):
+            new_score = score[i] + end - i
+            if new_score > score[end]:
+                score[end] = new_score
+                back[end] = i
+    
+    # Walk the backpointers from the end of the text
+    spans = []
+    i = n
+    if unknown_start[i] != -1:
+        spans.append((unknown_start[i], i, False))
+        i = unknown_start[i]
+    while i > 0:
+        j = back[i]
+        spans.append((j, i, True))
+        if unknown_start[j] != -1:
+            spans.append((unknown_start[j], j, False))
+            i = unknown_start[j]
+        else:
+            i = j
+    spans.reverse()
+    return spans
+
+
+def segment_text(cleaned: str, vocabulary: Vocabulary, counters: Optional[Counter] = None,
+                 splits: Optional[Dict[str, List[str]]] = None) -> List[Tuple[str, bool]]:
+    """Segment cleaned text into (word, is_known) pairs
+    
+    Unknown runs are only split once the best path is known, so pkuseg runs
+    once per distinct unknown span on that path and never for candidates the
+    DP throws away. If `counters` is given it collects 'unknown_spans' and
+    'pkuseg_calls' for the analysis. `splits` holds pkuseg results that are
+    reused instead of calling pkuseg again (see segment_unknown).
+    """
+    result = []
+    resolved: Dict[str, List[str]] = {}
+    with profile_stage('dp'):
+        path = best_segmentation_path(cleaned, vocabulary.known_trie)
+    for start, end, is_known in path:
+        span = cleaned[start:end]
+        if is_known:
+            result.append((span, True))
+            continue
+        if counters is not None:
+            counters['unknown_spans'] += 1
+        if span not in resolved:
+            resolved[span] = segment_unknown(span, vocabulary.unknown_matcher, counters, splits)
+        result.extend((w, False) for w in resolved[span])
+    return result
+
+
+# Combining marks (category Mn) met so far
+combining_marks: Set[str] = set()
+# Characters whose category has already been looked up
+classified_chars: Set[str] = set()
+
+
+def strip_combining_marks(text: str) -> str:
+    """Delete combining marks (diacritics) from text.
+    
+    CJK ideographs are never marks, so only the other characters are
+    collected, and each distinct one is classified once per process. Marks
+    that occur are then deleted in one regex pass over the whole text.
+    """
+    chars = set(CJK_RUN_RE.sub('', text))
+    unseen = chars - classified_chars
+    if unseen:
+        combining_marks.update(c for c in unseen if unicodedata.category(c) == "Mn")
+        classified_chars.update(unseen)
+    marks = chars & combining_marks
+    if marks:
+        return re.sub('[' + ''.join(sorted(marks)) + ']', '', text)
+    return text
+
+
+def clean_text(text: str) -> str:
+    """Remove whitespace and diacritics"""
+    text = "".join(text.split())
+    # Fast path: CJK ideographs have no decompositions and are not combining marks
+    if CJK_ONLY_RE.fullmatch(text):
+        return text
+    if not unicodedata.is_normalized("NFKD", text):
+        text = unicodedata.normalize("NFKD", text)
+    return strip_combining_marks(text)
+
+
+def iter_sentence_chunks(text: str, max_chars: int = NER_MAX_CHUNK_CHARS):
+    """Split text into chunks of whole sentences, each at most max_chars long.
+    
+    Consecutive sentences are packed together; a single sentence longer than
+    max_chars is cut into max_chars pieces.
+    """
+    start = 0  # Start of the current chunk
+    last = 0  # Last sentence boundary inside the current chunk
+    ends = itertools.chain((m.end() for m in SENTENCE_END_RE.finditer(text)), [len(text)])
+    for end in ends:
+        if end - start > max_chars and last > start:
+            yield text[start:last]
+            start = last
+        while end - start > max_chars:
+            yield text[start:start + max_chars]
+            start += max_chars
+        last = end
+    if last > start:
+        yield text[start:last]
+
+
+def detect_proper_nouns(texts: Iterable[str], options: NerOptions = DEFAULT_NER_OPTIONS) -> List[Optional[Set[str]]]:
+    """Detect proper nouns (names, places, organizations) in each text using spaCy NER.
+    
+    Texts are split into sentence-bounded chunks that are streamed through
+    nlp.pipe in batches, so spaCy's max_length never applies and memory stays
+    flat however long a text is. Entities from all chunks of a text are
+    merged. If NER is unavailable or fails every text gets None, so analysis
+    can continue without proper noun exclusion but knows not to keep the
+    result.
+    """
+    texts = list(texts)
+    proper_nouns: List[Set[str]] = [set() for _ in texts]
+    if not any(texts):
+        return proper_nouns  # Nothing to look at, so don't load the pipeline
+    chunks = (
+        (chunk, idx)
+        for idx, text in enumerate(texts)
+        for chunk in iter_sentence_chunks(text, options.max_chunk_chars)
+    )
+    try:
+        with profile_stage('ner'):
             nlp = get_spacy_nlp()
-            # Process the cleaned text for NER
-            doc = nlp(cleaned)
-            # Extract proper nouns (PERSON, GPE=location, ORG, FAC=facility, LOC)
-            for ent in doc.ents:
-                if ent.label_ in ['PERSON', 'GPE', 'ORG', 'FAC', 'LOC']:
-                    proper_nouns.add(ent.text)
-        except Exception as e:
-            logger.warning(f"NER detection failed: {e}. Continuing without proper noun exclusion.")
-        
-        # Filter to valid Chinese words only
-        def is_valid(word: str) -> bool:
-            return (
-                word.strip()
-                and not word.isdigit()
-                and not all(c in PUNCTUATION_CHARS for c in word)
-                and not any(c.isascii() and (c.isalpha() or c.isdigit()) for c in word)
-                and word not in proper_nouns  # Exclude detected proper nouns
-            )
-        
-        words = [word for word, _ in result if is_valid(word)]
-        
-        if not words:
-            return "Error: No Chinese text found after filtering"
-        
-        # Calculate stats
-        word_counts = Counter(words)
-        # A word is known if:
-        # 1. It's explicitly in base_words (known.txt) - always treated as known, even if in unknown.txt
-        # 2. It's NOT in unknown_words_list (explicit unknown words take precedence)
-        def is_known(w):
-            # Explicit entries in known.txt are always known (even if in unknown.txt)
-            if w in base_words:
-                return True
-            # Otherwise, it's unknown
-            return False
-        
-        total_words = len(words)
-        unique_words = len(word_counts)
-        known_count = sum(count for word, count in word_counts.items() if is_known(word))
-        unknown_words = sorted(
-            [(w, c) for w, c in word_counts.items() if not is_known(w)],
-            key=lambda x: x[1], reverse=True
-        )
-        comprehension_pct = known_count / total_words * 100
-        
-        
-        # Determine difficulty assessment (accounting for ~3% pkuseg segmentation error)
-        # Actual comprehension is likely 3% higher than shown due to over-segmentation
-        def get_assessment(pct: float) -> str:
-            if pct < 82:
-                return "⛔ Too Difficult"
-            elif pct < 87:
-                return "🔴 Very Challenging"
-            elif pct < 89:
-                return "🟡 Challenging"
-            elif pct < 92:
-                return "🟢 Optimal (i+1)"
-            elif pct < 95:
-                return "🔵 Comfortable"
-            else:
-                return "⚪ Too Easy"
-        
-        assessment = get_assessment(comprehension_pct)
+            for doc, idx in nlp.pipe(chunks, as_tuples=True, batch_size=options.batch_size,
+                                     n_process=options.n_process):
+                proper_nouns[idx].update(ent.text for ent in doc.ents if ent.label_ in NER_LABELS)
+    except Exception as e:
+        logger.warning(f"NER detection failed: {e}. Continuing without proper noun exclusion.")
+        return [None for _ in texts]
+    return proper_nouns
+
+
+def get_assessment(pct: float) -> str:
+    """Determine difficulty assessment (accounting for ~3% pkuseg segmentation error)
+    
+    Actual comprehension is likely 3% higher than shown due to over-segmentation.
+    """
+    if pct < 82:
+        return "⛔ Too Difficult"
+    elif pct < 87:
+        return "🔴 Very Challenging"
+    elif pct < OPTIMAL_BAND[0]:
+        return "🟡 Challenging"
+    elif pct < OPTIMAL_BAND[1]:
+        return "🟢 Optimal (i+1)"
+    elif pct < 95:
+        return "🔵 Comfortable"
+    else:
+        return "⚪ Too Easy"
+
+
+def word_filter_reason(word: str) -> Optional[str]:
+    """Why a segmented token does not count as a word, or None if it does.
+    
+    Proper nouns are not checked here, see count_words.
+    """
+    if word and CJK_ONLY_RE.fullmatch(word):
+        return None  # Nearly every token: plain ideographs
+    if not word.strip():
+        return 'empty'
+    if word.isdigit():
+        return 'digit'
+    classes = word.translate(WORD_CLASS_TABLE)
+    if not classes.strip('P'):
+        return 'punctuation'
+    if 'A' in classes:
+        return 'ascii'
+    return None
+
+
+def count_words(tokens: Iterable[str], proper_nouns: Set[str],
+                dropped: Optional[Counter] = None) -> Counter:
+    """Count the tokens that are valid words, in order of first occurrence.
+    
+    Each distinct token is classified once however often it occurs. If
+    `dropped` is given, occurrences of the other tokens are added to it by
+    reason (one of WORD_FILTER_REASONS).
+    """
+    words = Counter()
+    for token, count in Counter(tokens).items():
+        reason = word_filter_reason(token)
+        if reason is None and token in proper_nouns:
+            reason = 'proper_noun'  # Exclude detected proper nouns
+        if reason is None:
+            words[token] = count
+        elif dropped is not None:
+            dropped[reason] += count
+    return words
+
+
+def analyze_text(text: str, known_words_dir: str = KNOWN_WORDS_DIR,
+                 counters: Optional[Counter] = None,
+                 proper_nouns: Optional[Set[str]] = None,
+                 splits: Optional[Dict[str, List[str]]] = None,
+                 vocabulary: Optional[Vocabulary] = None,
+                 cleaned: Optional[str] = None) -> AnalysisResult:
+    """Segment text, exclude proper nouns and measure comprehension against known words.
+    
+    Args:
+        text: The Chinese text to analyze
+        known_words_dir: Directory containing known words files
+        counters: Optional Counter that the analysis' counts such as 'pkuseg_calls' are
+            added to; the result's `counters` holds them for this analysis alone
+        proper_nouns: Proper nouns already detected for this text (e.g. by a batched
+            detect_proper_nouns call); NER runs here if not given
+        splits: pkuseg results for this text's unknown spans, reused and extended
+        vocabulary: Word lists to use instead of loading them from known_words_dir
+        cleaned: clean_text(text), if the caller already has it
+    
+    Raises:
+        FileNotFoundError: If the known words directory does not exist
+        ValueError: If there is no Chinese text to analyze
+    """
+    # Known/unknown word lists and their tries are built once and reused
+    if vocabulary is None:
+        vocabulary = load_vocabulary(known_words_dir)
+    base_words = vocabulary.known_words
+    
+    if not text:
+        raise ValueError("No text provided")
+    
+    # Clean up: remove whitespace and diacritics
+    if cleaned is None:
+        with profile_stage('clean'):
+            cleaned = clean_text(text)
+    
+    if not cleaned:
+        raise ValueError("No Chinese text found after filtering")
+    
+    # DP tokenization to maximize known word coverage
+    analysis_counters = Counter()
+    result = segment_text(cleaned, vocabulary, analysis_counters, splits)
+    if counters is not None:
+        counters.update(analysis_counters)
+    
+    # Detect proper nouns using spaCy NER
+    if proper_nouns is None:
+        proper_nouns = detect_proper_nouns([cleaned])[0] or set()
+    
+    # Filter to valid Chinese words only, noting why the other tokens were dropped
+    dropped = Counter()
+    word_counts = count_words((word for word, _ in result), proper_nouns, dropped)
+    
+    if not word_counts:
+        raise ValueError("No Chinese text found after filtering")
+    
+    # Calculate stats
+    # A word is known if:
+    # 1. It's explicitly in base_words (known.txt) - always treated as known, even if in unknown.txt
+    # 2. It's NOT in unknown_words_list (explicit unknown words take precedence)
+    def is_known(w):
+        # Explicit entries in known.txt are always known (even if in unknown.txt)
+        if w in base_words:
+            return True
+        # Otherwise, it's unknown
+        return False
+    
+    total_words = sum(word_counts.values())
+    known_count = sum(count for word, count in word_counts.items() if is_known(word))
+    unknown_words = sorted(
+        [(w, c) for w, c in word_counts.items() if not is_known(w)],
+        key=lambda x: x[1], reverse=True
+    )
+    comprehension_pct = known_count / total_words * 100
+    
+    return AnalysisResult(
+        segmentation=result,
+        proper_nouns=sorted(proper_nouns),
+        total_words=total_words,
+        unique_words=len(word_counts),
+        known_count=known_count,
+        comprehension_pct=comprehension_pct,
+        assessment=get_assessment(comprehension_pct),
+        unknown_words=unknown_words,
+        dropped=dict(dropped),
+        counters={name: analysis_counters[name] for name in SEGMENTER_COUNTERS},
+    )
+
+
+def tone_pinyin(word: str) -> str:
+    """Tone-marked pinyin of a word"""
+    from pypinyin import pinyin, Style
+    with profile_stage('pinyin'):
+        return ' '.join(p[0] for p in pinyin(word, style=Style.TONE))
+
+
+def describe_word(word: str, cedict: Optional[Mapping],
+                  known_pinyin: Optional[Mapping] = None) -> Tuple[str, Optional[str]]:
+    """Tone-marked pinyin of a word and its CC-CEDICT definition (None if not listed)
+    
+    Pinyin is taken from `known_pinyin` (an analysis' stored pinyin) when it has the word.
+    """
+    if known_pinyin and word in known_pinyin:
+        word_pinyin = known_pinyin[word]
+    else:
+        word_pinyin = tone_pinyin(word)
+    # Fast offline definition lookup from CC-CEDICT
+    definition = cedict[word] if cedict and word in cedict else None
+    return word_pinyin, definition
+
+
+def analysis_record(analysis: AnalysisResult, profile: Optional[StageProfile] = None) -> dict:
+    """An analysis as a JSON-serializable record.
+    
+    Unlike the text report, every unknown word is listed, with its full
+    definition. `profile` holds the stages run for this analysis; building
+    the record is added to it as 'format'.
+    """
+    with profiling(profile), profile_stage('format'):
+        cedict = get_cedict_service().get()
+        unknown_words = []
+        for word, count in analysis.unknown_words:
+            word_pinyin, definition = describe_word(word, cedict, analysis.pinyin)
+            unknown_words.append({'word': word, 'count': count, 'pinyin': word_pinyin, 'definition': definition})
+    
+    return {
+        'total_words': analysis.total_words,
+        'unique_words': analysis.unique_words,
+        'known_count': analysis.known_count,
+        'unknown_count': analysis.total_words - analysis.known_count,
+        'comprehension_pct': round(analysis.comprehension_pct, 2),
+        'assessment': analysis.assessment,
+        'proper_nouns': analysis.proper_nouns,
+        'dropped': analysis.dropped or {},
+        'counters': analysis.counters or {},
+        'unknown_words': unknown_words,
+        'stages': profile.as_dict() if profile is not None else {},
+    }
+
+
+def format_report(analysis: AnalysisResult) -> str:
+    """Format an analysis as the human-readable report"""
+    with profile_stage('format'):
+        # CC-CEDICT is loaded once per process and shared by all analyses
+        cedict = get_cedict_service().get()
+        unknown_words = analysis.unknown_words
         
-        # Format output
         lines = [
-            f"\nWord Count: {total_words}",
-            f"Total Unique Words: {unique_words}",
-            f"Comprehension: {comprehension_pct:.1f}% - {assessment}",
+            f"\nWord Count: {analysis.total_words}",
+            f"Total Unique Words: {analysis.unique_words}",
+            f"Comprehension: {analysis.comprehension_pct:.1f}% - {analysis.assessment}",
             f"Unique Unknown Words: {len(unknown_words)}"
         ]
         
@@ -335,12 +1245,10 @@ def comprehension_checker(text: str, known_words_dir: str = KNOWN_WORDS_DIR) ->
             display_count = min(len(unknown_words), MAX_UNKNOWN_WORDS_DISPLAY)
             
             for idx, (word, count) in enumerate(unknown_words[:display_count]):
-                word_pinyin = ' '.join(p[0] for p in pinyin(word, style=Style.TONE))
+                word_pinyin, meaning = describe_word(word, cedict, analysis.pinyin)
                 
-                # Fast offline definition lookup from CC-CEDICT
                 definition = ""
-                if cedict and word in cedict:
-                    meaning = cedict[word]
+                if meaning is not None:
                     if len(meaning) > 80:
                         meaning = meaning[:77] + "..."
                     definition = f" - {meaning}"
@@ -351,67 +1259,1458 @@ def comprehension_checker(text: str, known_words_dir: str = KNOWN_WORDS_DIR) ->
                 lines.append(f"... and {len(unknown_words) - display_count} more")
         
         return '\n'.join(lines)
-        
-    except FileNotFoundError as e:
-        return f"Error: {str(e)}"
-    except ValueError as e:
-        return f"Error: {str(e)}"
-    except Exception as e:
-        return f"Error: An unexpected error occurred: {str(e)}"
 
 
-def process_input_files(input_dir: str = INPUT_DIR) -> None:
-    """Process all txt files in the input directory and generate reports.
+def iter_text_chunks(f, chunk_chars: int = STREAM_CHUNK_CHARS):
+    """Read a text file in pieces that end at a sentence boundary where possible.
     
-    Args:
-        input_dir: Directory containing input text files to analyze
+    Each piece holds about chunk_chars characters; if no sentence ends within
+    chunk_chars the piece is cut there instead.
     """
-    if not os.path.exists(input_dir):
+    buffer = ''
+    while True:
+        block = f.read(chunk_chars)
+        if not block:
+            break
+        buffer += block
+        last = None
+        for m in SENTENCE_END_RE.finditer(buffer):
+            last = m.end()
+        if last is None:
+            if len(buffer) >= chunk_chars:
+                yield buffer
+                buffer = ''
+            continue
+        yield buffer[:last]
+        buffer = buffer[last:]
+    if buffer:
+        yield buffer
+
+
+class PipeReader:
+    """Text reader over a binary stream such as stdin or a named pipe.
+    
+    read() returns whatever text has arrived instead of blocking until the
+    requested size is filled, so analysis can start on partial input.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def read(self, size: int) -> str:
+        while True:
+            data = self.raw.read1(size)
+            text = self.decoder.decode(data, final=not data)
+            if text or not data:
+                return text
+
+
+class StreamingAnalyzer:
+    """Comprehension analysis of text that arrives in pieces.
+    
+    Each piece is segmented together with the unsegmented tail of the previous
+    one. Only words ending before the last STREAM_OVERLAP_CHARS characters are
+    committed, so a word is never split at a piece boundary. Word counts and
+    proper nouns accumulate as pieces arrive, so memory depends on the piece
+    size and vocabulary, not on the length of the text. The segmentation
+    itself is not kept. Stages run for the stream are recorded in `profile`.
+    
+    The statistics approximate those of analyzing the whole text at once:
+    pkuseg can split an unknown stretch differently when it straddles a piece
+    boundary, which may shift a word or so per boundary.
+    """
+
+    def __init__(self, vocabulary: Optional[Vocabulary] = None,
+                 ner_options: NerOptions = DEFAULT_NER_OPTIONS,
+                 overlap: int = STREAM_OVERLAP_CHARS):
+        self.profile = StageProfile()
+        with profiling(self.profile):
+            self.vocabulary = vocabulary or load_vocabulary()
+        self.ner_options = ner_options
+        self.overlap = overlap
+        self.word_counts: Counter = Counter()
+        self.dropped: Counter = Counter()
+        self.proper_nouns: Set[str] = set()
+        self.counters: Counter = Counter()
+        self.chars = 0
+        self._carry = ''
+
+    def feed(self, text: str) -> None:
+        """Add the next piece of text"""
+        self.chars += len(text)
+        with profiling(self.profile):
+            with profile_stage('clean'):
+                cleaned = clean_text(text)
+            self.proper_nouns.update(detect_proper_nouns([cleaned], self.ner_options)[0] or ())
+            self._segment(self._carry + cleaned, final=False)
+
+    def _segment(self, buffer: str, final: bool) -> None:
+        with profile_stage('dp'):
+            spans = best_segmentation_path(buffer, self.vocabulary.known_trie)
+        cut = len(buffer)
+        if not final:
+            limit = len(buffer) - self.overlap
+            cut = max((end for _, end, _ in spans if end <= limit), default=0)
+            if cut == 0 and limit > 0:
+                cut = limit  # A single unknown run covers the whole committable part
+        
+        tokens = []
+        for start, end, is_known in spans:
+            if start >= cut:
+                break
+            span = buffer[start:min(end, cut)]
+            if is_known:
+                tokens.append(span)
+            else:
+                self.counters['unknown_spans'] += 1
+                tokens.extend(segment_unknown(span, self.vocabulary.unknown_matcher, self.counters))
+        # Proper nouns are only known once the whole text is read; they are dropped in result()
+        self.word_counts.update(count_words(tokens, set(), self.dropped))
+        self._carry = buffer[cut:]
+
+    def result(self) -> AnalysisResult:
+        """Statistics for the text committed so far"""
+        base_words = self.vocabulary.known_words
+        word_counts = {w: c for w, c in self.word_counts.items() if w not in self.proper_nouns}
+        dropped = Counter(self.dropped)
+        dropped['proper_noun'] += sum(self.word_counts[w] for w in self.proper_nouns if w in self.word_counts)
+        total_words = sum(word_counts.values())
+        if not total_words:
+            raise ValueError("No Chinese text found after filtering")
+        
+        known_count = sum(c for w, c in word_counts.items() if w in base_words)
+        unknown_words = sorted(
+            [(w, c) for w, c in word_counts.items() if w not in base_words],
+            key=lambda x: x[1], reverse=True
+        )
+        comprehension_pct = known_count / total_words * 100
+        return AnalysisResult(
+            segmentation=[],
+            proper_nouns=sorted(self.proper_nouns),
+            total_words=total_words,
+            unique_words=len(word_counts),
+            known_count=known_count,
+            comprehension_pct=comprehension_pct,
+            assessment=get_assessment(comprehension_pct),
+            unknown_words=unknown_words,
+            dropped={reason: count for reason, count in dropped.items() if count},
+            counters={name: self.counters[name] for name in SEGMENTER_COUNTERS},
+        )
+
+    def finish(self) -> AnalysisResult:
+        """Commit the remaining tail and return the final statistics"""
+        if self._carry:
+            with profiling(self.profile):
+                self._segment(self._carry, final=True)
+        return self.result()
+
+
+def error_report(e: Exception) -> str:
+    """Format an analysis failure the way reports show it"""
+    if isinstance(e, (FileNotFoundError, ValueError, ConnectionError)):
+        return f"Error: {str(e)}"
+    return f"Error: An unexpected error occurred: {str(e)}"
+
+
+def comprehension_checker(text: str, known_words_dir: str = KNOWN_WORDS_DIR,
+                          counters: Optional[Counter] = None,
+                          proper_nouns: Optional[Set[str]] = None) -> str:
+    """Check comprehension of Chinese text against known words.
+    Automatically excludes proper nouns (names, places) for accurate comprehension measurement.
+    
+    Args:
+        text: The Chinese text to analyze
+        known_words_dir: Directory containing known words files
+        counters: Optional Counter that receives per-analysis counts such as 'pkuseg_calls'
+        proper_nouns: Proper nouns already detected for this text (e.g. by a batched
+            detect_proper_nouns call); NER runs here if not given
+    
+    Returns:
+        Analysis report as a string
+    """
+    try:
+        return format_report(analyze_text(text, known_words_dir, counters, proper_nouns))
+    except Exception as e:
+        return error_report(e)
+
+
+def comprehension_record(text: str, known_words_dir: str = KNOWN_WORDS_DIR) -> dict:
+    """Check comprehension of Chinese text, returning the structured record.
+    
+    Same analysis as comprehension_checker. Failures give {'error': message}
+    with the message shown in text reports.
+    """
+    profile = StageProfile()
+    try:
+        with profiling(profile):
+            analysis = analyze_text(text, known_words_dir)
+        return analysis_record(analysis, profile)
+    except Exception as e:
+        return {'error': error_report(e)}
+
+
+def model_versions() -> Dict[str, str]:
+    """Installed versions of the packages and models that shape analysis results"""
+    import importlib.metadata
+    versions = {}
+    for package in ('spacy-pkuseg', 'spacy', SPACY_MODEL):
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = 'missing'
+    return versions
+
+
+def settings_fingerprint(settings: dict) -> str:
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def ner_fingerprint(ner_options: NerOptions = DEFAULT_NER_OPTIONS) -> str:
+    """Fingerprint of the model and settings that NER entities depend on"""
+    versions = model_versions()
+    return settings_fingerprint({
+        'schema': CACHE_SCHEMA_VERSION,
+        'spacy': versions['spacy'],
+        'model': versions[SPACY_MODEL],
+        'ner_labels': sorted(NER_LABELS),
+        'ner_chunk_chars': ner_options.max_chunk_chars,
+    })
+
+
+def segmenter_fingerprint() -> str:
+    """Fingerprint of the pkuseg model that unknown-span splits depend on"""
+    return settings_fingerprint({
+        'schema': CACHE_SCHEMA_VERSION,
+        'pkuseg': model_versions()['spacy-pkuseg'],
+        'model': 'mixed',
+    })
+
+
+def analysis_fingerprint(vocabulary: Vocabulary, ner_options: NerOptions = DEFAULT_NER_OPTIONS) -> str:
+    """Fingerprint of everything besides the text itself that an analysis depends on"""
+    return settings_fingerprint({
+        'schema': CACHE_SCHEMA_VERSION,
+        'vocabulary': vocabulary.fingerprint,
+        'ner': ner_fingerprint(ner_options),
+        'segmenter': segmenter_fingerprint(),
+        'max_word_length': MAX_WORD_LENGTH,
+    })
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """Open a SQLite database that several processes may share"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+class SqliteStore:
+    """A SQLite database opened on first use, once per process.
+    
+    Subclasses create their tables in _create_schema.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Connections cannot cross process boundaries; workers open their own
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        return state
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        raise NotImplementedError
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = open_sqlite(self.path)
+            self._create_schema(conn)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def available(self) -> bool:
+        """Open the database now; False, with a warning, if it can't be used"""
+        try:
+            self._connection()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"{type(self).__name__} unavailable at '{self.path}' ({e}), continuing without it")
+            return False
+        return True
+
+
+class ResultCache(SqliteStore):
+    """Content-addressed on-disk cache of analysis results, stored in SQLite.
+    
+    Three layers are kept, each keyed by a hash of the text plus a fingerprint
+    of what produced the entry, so any change to those simply misses:
+    
+    - results: complete analyses, tied to the known/unknown word lists
+    - entities: NER proper nouns per text, independent of the word lists
+    - splits: pkuseg splits of a text's unknown spans, independent of the word lists
+    
+    After a vocabulary change, results miss but entities and splits still hit,
+    so only the cheap DP and stats are recomputed. Eviction drops entries not
+    used for max_age_days, then the least recently used ones until the cache
+    holds at most max_bytes.
+    """
+
+    TABLES = ('results', 'entities', 'splits')
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES,
+                 max_age_days: float = CACHE_MAX_AGE_DAYS):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        for table in self.TABLES:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ('
+                'key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL, '
+                'created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)')
+
+    @staticmethod
+    def key(text: str, fingerprint: str) -> str:
+        digest = hashlib.sha256(fingerprint.encode('utf-8'))
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _get(self, table: str, key: str):
+        conn = self._connection()
+        row = conn.execute(f'SELECT payload FROM {table} WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute(f'UPDATE {table} SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def _put(self, table: str, key: str, value) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?)',
+                (key, payload, len(payload.encode('utf-8')), now, now)
+            )
+
+    def get(self, key: str) -> Optional[AnalysisResult]:
+        payload = self._get('results', key)
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return AnalysisResult(**payload)
+
+    def put(self, key: str, analysis: AnalysisResult) -> None:
+        self._put('results', key, analysis._asdict())
+
+    def get_entities(self, key: str) -> Optional[Set[str]]:
+        payload = self._get('entities', key)
+        return None if payload is None else set(payload)
+
+    def put_entities(self, key: str, proper_nouns: Set[str]) -> None:
+        self._put('entities', key, sorted(proper_nouns))
+
+    def get_splits(self, key: str) -> Optional[Dict[str, List[str]]]:
+        return self._get('splits', key)
+
+    def put_splits(self, key: str, splits: Dict[str, List[str]]) -> None:
+        self._put('splits', key, splits)
+
+    def evict(self) -> int:
+        """Apply the age and size limits. Returns the number of entries removed."""
+        conn = self._connection()
+        removed = 0
+        with conn:
+            cutoff = time.time() - self.max_age_days * 86400
+            for table in self.TABLES:
+                removed += conn.execute(f'DELETE FROM {table} WHERE accessed_at < ?', (cutoff,)).rowcount
+            
+            total = sum(
+                conn.execute(f'SELECT COALESCE(SUM(size), 0) FROM {table}').fetchone()[0]
+                for table in self.TABLES
+            )
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                entries = ' UNION ALL '.join(
+                    f"SELECT '{table}', key, size, accessed_at FROM {table}" for table in self.TABLES
+                )
+                stale = []
+                for table, key, size, _ in conn.execute(f'{entries} ORDER BY accessed_at'):
+                    if excess <= 0:
+                        break
+                    stale.append((table, key))
+                    excess -= size
+                for table, key in stale:
+                    conn.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+                removed += len(stale)
+        return removed
+
+    def stats(self) -> CacheStats:
+        conn = self._connection()
+        entries = size = 0
+        for table in self.TABLES:
+            count, table_size = conn.execute(
+                f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {table}'
+            ).fetchone()
+            entries += count
+            size += table_size
+        return CacheStats(self.hits, self.misses, entries, size)
+
+
+def text_ngrams(cleaned: str) -> Set[str]:
+    """Distinct character unigrams and bigrams of a text"""
+    grams = set(cleaned)
+    grams.update(cleaned[i:i + 2] for i in range(len(cleaned) - 1))
+    return grams
+
+
+def word_ngrams(word: str) -> List[str]:
+    """N-grams that every text containing `word` must also contain"""
+    if len(word) == 1:
+        return [word]
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+def unknown_fingerprint(vocabulary: Vocabulary) -> str:
+    return hashlib.sha256('\n'.join(sorted(vocabulary.unknown_words)).encode('utf-8')).hexdigest()
+
+
+class LibraryIndex(SqliteStore):
+    """Persistent index of analyzed documents, stored in SQLite.
+    
+    Every analyzed document is recorded with its result, the fingerprint of
+    the vocabulary it was scored against, and postings from each character
+    unigram and bigram of its text. A known word can only change the result
+    of a document containing it as a substring, i.e. one that contains all
+    of the word's n-grams. So when known/ gains or loses words, only those
+    documents are re-scored (see rescore_library).
+    """
+
+    def __init__(self, path: str = LIBRARY_PATH):
+        super().__init__(path)
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL,
+                mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,
+                vocabulary TEXT NOT NULL, analysis TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (
+                gram TEXT NOT NULL, doc_id INTEGER NOT NULL,
+                PRIMARY KEY (gram, doc_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+            CREATE TABLE IF NOT EXISTS vocabularies (
+                fingerprint TEXT PRIMARY KEY, unknown TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS vocabulary_words (
+                fingerprint TEXT NOT NULL, word TEXT NOT NULL,
+                PRIMARY KEY (fingerprint, word)) WITHOUT ROWID;
+        """)
+
+    def record(self, documents: Iterable[Tuple[str, str, AnalysisResult, Optional[str]]],
+               vocabulary: Vocabulary) -> None:
+        """Store (or replace) the results and postings of documents in one transaction.
+        
+        Each document is (path, text, analysis, cleaned), where `cleaned` is
+        clean_text(text) if the caller already has it, else None. Documents
+        already stored for the same file and vocabulary are left alone, so
+        re-running over an unchanged library writes nothing.
+        """
+        conn = self._connection()
+        with conn:
+            remembered = False
+            for path, text, analysis, cleaned in documents:
+                st = os.stat(path)
+                row = conn.execute('SELECT doc_id, mtime_ns, size, vocabulary FROM documents WHERE path = ?',
+                                   (path,)).fetchone()
+                if row and tuple(row[1:]) == (st.st_mtime_ns, st.st_size, vocabulary.fingerprint):
+                    continue
+                if not remembered:
+                    self._remember_vocabulary(conn, vocabulary)
+                    remembered = True
+                payload = json.dumps(analysis._asdict(), ensure_ascii=False)
+                if row:
+                    doc_id = row[0]
+                    conn.execute(
+                        'UPDATE documents SET mtime_ns = ?, size = ?, vocabulary = ?, analysis = ? WHERE doc_id = ?',
+                        (st.st_mtime_ns, st.st_size, vocabulary.fingerprint, payload, doc_id)
+                    )
+                    conn.execute('DELETE FROM postings WHERE doc_id = ?', (doc_id,))
+                else:
+                    doc_id = conn.execute(
+                        'INSERT INTO documents (path, mtime_ns, size, vocabulary, analysis) VALUES (?, ?, ?, ?, ?)',
+                        (path, st.st_mtime_ns, st.st_size, vocabulary.fingerprint, payload)
+                    ).lastrowid
+                conn.executemany(
+                    'INSERT INTO postings VALUES (?, ?)',
+                    ((gram, doc_id) for gram in text_ngrams(clean_text(text) if cleaned is None else cleaned))
+                )
+
+    def _remember_vocabulary(self, conn: sqlite3.Connection, vocabulary: Vocabulary) -> None:
+        if conn.execute('SELECT 1 FROM vocabularies WHERE fingerprint = ?', (vocabulary.fingerprint,)).fetchone():
+            return
+        # Another worker may be recording the same vocabulary concurrently
+        conn.execute('INSERT OR IGNORE INTO vocabularies VALUES (?, ?)',
+                     (vocabulary.fingerprint, unknown_fingerprint(vocabulary)))
+        conn.executemany('INSERT OR IGNORE INTO vocabulary_words VALUES (?, ?)',
+                         ((vocabulary.fingerprint, word) for word in vocabulary.known_words))
+
+    def documents(self) -> List[Tuple[str, int, int, str]]:
+        """(path, mtime_ns, size, vocabulary fingerprint) of every indexed document"""
+        return self._connection().execute(
+            'SELECT path, mtime_ns, size, vocabulary FROM documents ORDER BY path'
+        ).fetchall()
+
+    def vocabulary(self, fingerprint: str) -> Optional[Tuple[Set[str], str]]:
+        """Known words and unknown-list fingerprint of a vocabulary documents were scored against"""
+        conn = self._connection()
+        row = conn.execute('SELECT unknown FROM vocabularies WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        if row is None:
+            return None
+        words = conn.execute('SELECT word FROM vocabulary_words WHERE fingerprint = ?', (fingerprint,))
+        return {word for word, in words}, row[0]
+
+    def paths_containing(self, word: str) -> Set[str]:
+        """Documents that may contain `word` (a superset; all of its n-grams occur)"""
+        grams = word_ngrams(word)
+        query = ' INTERSECT '.join(['SELECT doc_id FROM postings WHERE gram = ?'] * len(grams))
+        rows = self._connection().execute(
+            f'SELECT path FROM documents WHERE doc_id IN ({query})', grams
+        )
+        return {path for path, in rows}
+
+    def mark_scored(self, paths: Iterable[str], vocabulary: Vocabulary) -> None:
+        """Record that documents' stored results are still valid under `vocabulary`"""
+        conn = self._connection()
+        with conn:
+            self._remember_vocabulary(conn, vocabulary)
+            conn.executemany('UPDATE documents SET vocabulary = ? WHERE path = ?',
+                             ((vocabulary.fingerprint, path) for path in paths))
+
+    def remove(self, path: str) -> None:
+        conn = self._connection()
+        with conn:
+            row = conn.execute('SELECT doc_id FROM documents WHERE path = ?', (path,)).fetchone()
+            if row:
+                conn.execute('DELETE FROM postings WHERE doc_id = ?', row)
+                conn.execute('DELETE FROM documents WHERE doc_id = ?', row)
+
+    def prune_vocabularies(self) -> None:
+        """Forget vocabularies no document is scored against any more"""
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM vocabulary_words WHERE fingerprint NOT IN (SELECT vocabulary FROM documents)')
+            conn.execute('DELETE FROM vocabularies WHERE fingerprint NOT IN (SELECT vocabulary FROM documents)')
+
+    def ranking(self) -> List[Tuple[str, AnalysisResult]]:
+        """Every document with its stored result, most comprehensible first"""
+        rows = self._connection().execute('SELECT path, analysis FROM documents').fetchall()
+        ranked = [(path, AnalysisResult(**json.loads(payload))) for path, payload in rows]
+        ranked.sort(key=lambda item: item[1].comprehension_pct, reverse=True)
+        return ranked
+
+
+def rescore_library(library: LibraryIndex, ner_options: NerOptions = DEFAULT_NER_OPTIONS,
+                    cache: Optional[ResultCache] = None) -> Tuple[int, int]:
+    """Bring every indexed document up to date with the current word lists.
+    
+    Only documents containing a word added to or removed from known/ since
+    they were scored are re-analyzed, plus any whose file changed. All of a
+    document's results are recomputed if the unknown word list changed.
+    
+    Returns (documents re-scored, documents indexed).
+    """
+    vocabulary = load_vocabulary()
+    current_unknown = unknown_fingerprint(vocabulary)
+    documents = library.documents()
+    
+    stale: Set[str] = set()
+    still_valid: List[str] = []
+    by_vocabulary: Dict[str, List[str]] = {}
+    for path, mtime_ns, size, fingerprint in documents:
+        try:
+            st = os.stat(path)
+        except OSError:
+            library.remove(path)
+            continue
+        if (st.st_mtime_ns, st.st_size) != (mtime_ns, size):
+            stale.add(path)
+        elif fingerprint != vocabulary.fingerprint:
+            by_vocabulary.setdefault(fingerprint, []).append(path)
+    
+    for fingerprint, paths in by_vocabulary.items():
+        scored_with = library.vocabulary(fingerprint)
+        if scored_with is None or scored_with[1] != current_unknown:
+            stale.update(paths)
+            continue
+        affected: Set[str] = set()
+        for word in scored_with[0] ^ vocabulary.known_words:
+            affected |= library.paths_containing(word)
+        stale.update(path for path in paths if path in affected)
+        still_valid.extend(path for path in paths if path not in affected)
+    
+    library.mark_scored(still_valid, vocabulary)
+    
+    stale_paths = []
+    texts = []
+    for path in sorted(stale):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                texts.append(f.read())
+        except (OSError, ValueError) as e:
+            logger.error(f"Error processing '{path}': {e}")
+            library.remove(path)  # No longer readable
+            continue
+        stale_paths.append(path)
+    cleaned_texts: List[Optional[str]] = [None] * len(texts)
+    outcomes = analyze_texts(texts, ner_options, cache, cleaned_texts=cleaned_texts)
+    rescored = []
+    for path, text, cleaned, (outcome, _) in zip(stale_paths, texts, cleaned_texts, outcomes):
+        if isinstance(outcome, AnalysisResult):
+            rescored.append((path, text, outcome, cleaned))
+        else:
+            library.remove(path)  # No longer analyzable, e.g. emptied
+    library.record(rescored, vocabulary)
+    
+    library.prune_vocabularies()
+    return len(stale_paths), len(library.documents())
+
+
+class RankingIndex:
+    """Per-document word-count vectors for ranking a library against any known-word set.
+    
+    Counts of each document's valid words are stored as a sparse matrix
+    (documents x word ids, kept as flat numpy arrays), so scoring every
+    document for a learner is a handful of vectorized operations instead of
+    re-segmenting anything. Documents keep the segmentation they were
+    analyzed with, so scores for a very different known set are approximate.
+    """
+
+    def __init__(self, paths: List[str], words: List[str], doc_ids: 'np.ndarray',
+                 word_ids: 'np.ndarray', counts: 'np.ndarray'):
+        import numpy as np
+        self.paths = paths
+        self.words = words
+        self.word_index = {word: i for i, word in enumerate(words)}
+        self.doc_ids = doc_ids  # Document of each non-zero entry
+        self.word_ids = word_ids  # Word of each non-zero entry
+        self.counts = counts  # Occurrences for each non-zero entry
+        self.totals = np.bincount(doc_ids, weights=counts, minlength=len(paths))
+
+    @classmethod
+    def from_library(cls, library: LibraryIndex) -> 'RankingIndex':
+        return cls.from_analyses(library.ranking())
+
+    @classmethod
+    def from_analyses(cls, analyses: Iterable[Tuple[str, AnalysisResult]]) -> 'RankingIndex':
+        import numpy as np
+        paths, doc_ids, word_ids, counts = [], [], [], []
+        word_index: Dict[str, int] = {}
+        for path, analysis in analyses:
+            word_counts = count_words((word for word, _ in analysis.segmentation),
+                                      set(analysis.proper_nouns))
+            doc_id = len(paths)
+            paths.append(path)
+            for word, count in word_counts.items():
+                doc_ids.append(doc_id)
+                word_ids.append(word_index.setdefault(word, len(word_index)))
+                counts.append(count)
+        return cls(paths, list(word_index), np.array(doc_ids, dtype=np.int32),
+                   np.array(word_ids, dtype=np.int32), np.array(counts, dtype=np.float64))
+
+    def save(self, path: str = RANKING_PATH) -> None:
+        import numpy as np
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(f, paths=np.array(self.paths, dtype=str), words=np.array(self.words, dtype=str),
+                     doc_ids=self.doc_ids, word_ids=self.word_ids, counts=self.counts)
+
+    @classmethod
+    def load(cls, path: str = RANKING_PATH) -> 'RankingIndex':
+        import numpy as np
+        with np.load(path) as data:
+            return cls(data['paths'].tolist(), data['words'].tolist(),
+                       data['doc_ids'], data['word_ids'], data['counts'])
+
+    def known_mask(self, known_words: Iterable[str]) -> 'np.ndarray':
+        """Boolean vector over word ids marking the known words"""
+        import numpy as np
+        mask = np.zeros(len(self.words), dtype=bool)
+        ids = [self.word_index[word] for word in known_words if word in self.word_index]
+        mask[ids] = True
+        return mask
+
+    def comprehension(self, known_words: Iterable[str]) -> 'np.ndarray':
+        """Comprehension percentage of every document for a known-word set"""
+        import numpy as np
+        mask = self.known_mask(known_words)
+        known = np.bincount(self.doc_ids, weights=self.counts * mask[self.word_ids],
+                            minlength=len(self.paths))
+        return known / np.maximum(self.totals, 1) * 100
+
+    def comprehension_matrix(self, known_sets: List[Iterable[str]],
+                             max_entries: int = 50_000_000) -> 'np.ndarray':
+        """Comprehension percentage of every document for many known-word sets at once.
+        
+        Returns a (len(known_sets) x documents) array. Known sets are stacked
+        into a boolean matrix over the shared word ids and scored in groups
+        whose intermediate (sets x non-zero entries) array stays below
+        max_entries.
+        """
+        import numpy as np
+        n_docs = len(self.paths)
+        masks = np.array([self.known_mask(words) for words in known_sets], dtype=bool)
+        masks = masks.reshape(len(known_sets), len(self.words))
+        result = np.empty((len(known_sets), n_docs))
+        group = max(1, max_entries // max(len(self.counts), 1))
+        for start in range(0, len(known_sets), group):
+            block = masks[start:start + group]
+            weights = block[:, self.word_ids] * self.counts
+            # Offset each set's document ids so one bincount fills the whole block
+            targets = self.doc_ids + n_docs * np.arange(len(block))[:, None]
+            known = np.bincount(targets.ravel(), weights=weights.ravel(), minlength=len(block) * n_docs)
+            result[start:start + len(block)] = known.reshape(len(block), n_docs)
+        return result / np.maximum(self.totals, 1) * 100
+
+    def recommend(self, known_words: Iterable[str], top_k: int = 10) -> List[Tuple[str, float]]:
+        """The top_k documents closest to the Optimal (i+1) band, best first"""
+        import numpy as np
+        pct = self.comprehension(known_words)
+        low, high = OPTIMAL_BAND
+        # Distance outside the band first, then distance from its centre
+        distance = np.maximum(low - pct, 0) + np.maximum(pct - high, 0)
+        centre = np.abs(pct - (low + high) / 2)
+        top_k = min(top_k, len(self.paths))
+        if top_k <= 0:
+            return []
+        candidates = np.argpartition(distance, top_k - 1)[:top_k]
+        cutoff = distance[candidates].max()
+        # Keep ties at the cut-off so the centre tie-break sees all of them
+        candidates = np.flatnonzero(distance <= cutoff)
+        order = candidates[np.lexsort((centre[candidates], distance[candidates]))][:top_k]
+        return [(self.paths[i], float(pct[i])) for i in order]
+
+
+def load_ranking_index(library: LibraryIndex, path: str = RANKING_PATH) -> RankingIndex:
+    """Load the saved ranking index, rebuilding it if the library changed since it was saved"""
+    def mtime(file_path):
+        try:
+            return os.stat(file_path).st_mtime_ns
+        except OSError:
+            return 0
+    
+    library_mtime = max(mtime(library.path), mtime(library.path + '-wal'))
+    if os.path.exists(path) and mtime(path) >= library_mtime:
+        return RankingIndex.load(path)
+    index = RankingIndex.from_library(library)
+    index.save(path)
+    return index
+
+
+def score_learners(input_dir: str, learners_dir: str, ner_options: NerOptions = DEFAULT_NER_OPTIONS,
+                   cache: Optional[ResultCache] = None) -> Tuple[List[str], List[str], 'np.ndarray']:
+    """Score every input file for every learner profile in one pass.
+    
+    Each subdirectory of learners_dir is a learner's known words directory.
+    Documents are segmented once against the union of all learners' known
+    words, then scored for every learner with one vectorized pass.
+    
+    Returns (learner names, document paths, learners x documents comprehension).
+    """
+    learners = sorted(
+        name for name in os.listdir(learners_dir)
+        if os.path.isdir(os.path.join(learners_dir, name))
+    )
+    vocabularies = [load_vocabulary(os.path.join(learners_dir, name)) for name in learners]
+    known_sets = [vocabulary.known_words for vocabulary in vocabularies]
+    unknown_words = vocabularies[0].unknown_words if vocabularies else set()
+    union = build_vocabulary(set().union(*known_sets), unknown_words)
+    
+    paths = []
+    texts = []
+    for txt_file in sorted(f for f in os.listdir(input_dir) if f.endswith('.txt')):
+        path = os.path.join(input_dir, txt_file)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                texts.append(f.read())
+        except (OSError, ValueError) as e:
+            # Left out of the table, like texts that can't be analyzed
+            logger.error(f"Error processing '{txt_file}': {e}")
+            continue
+        paths.append(path)
+    
+    analyses = [
+        (path, outcome)
+        for path, (outcome, _) in zip(paths, analyze_texts(texts, ner_options, cache, union))
+        if isinstance(outcome, AnalysisResult)
+    ]
+    index = RankingIndex.from_analyses(analyses)
+    return learners, index.paths, index.comprehension_matrix(known_sets)
+
+
+def warm_up(known_words_dir: str = KNOWN_WORDS_DIR) -> None:
+    """Load the segmenter, NER model, CC-CEDICT and word lists ahead of the first analysis"""
+    get_pkuseg_segmenter()
+    try:
+        get_spacy_nlp()
+    except Exception as e:
+        logger.warning(f"NER model unavailable: {e}. Continuing without proper noun exclusion.")
+    get_cedict_service().get()
+    try:
+        load_vocabulary(known_words_dir)
+    except FileNotFoundError as e:
+        logger.warning(str(e))
+
+
+def init_worker(warm: bool = True, trace_memory: bool = False) -> None:
+    """Set up a worker process: start allocation tracing for --profile, load models"""
+    if trace_memory:
+        tracemalloc.start()
+    if warm:
+        warm_up()
+
+
+class AnalysisRequestHandler(socketserver.StreamRequestHandler):
+    """Answers newline-delimited JSON requests: {"text": ..., "known_words_dir": ...} -> {"report": ...}
+    
+    Requests with "format": "ndjson" are answered with {"record": ...} instead.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                known_words_dir = request.get('known_words_dir', KNOWN_WORDS_DIR)
+                # pkuseg and spaCy are not guaranteed to be thread-safe
+                with self.server.analysis_lock:
+                    if request.get('format') == 'ndjson':
+                        response = {'record': comprehension_record(request['text'], known_words_dir)}
+                    else:
+                        response = {'report': comprehension_checker(request['text'], known_words_dir)}
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'error': f"Bad request: {e}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class AnalysisServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Long-running server that keeps models, dictionaries and word lists resident"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = DAEMON_SOCKET):
+        if os.path.exists(socket_path):
+            if server_listening(socket_path):
+                raise FileExistsError(f"A server is already listening on {socket_path}")
+            os.unlink(socket_path)  # Stale socket left by a previous server
+        self.analysis_lock = threading.Lock()
+        super().__init__(socket_path, AnalysisRequestHandler)
+
+
+def serve(socket_path: str = DAEMON_SOCKET) -> None:
+    """Run the warm analysis server until interrupted"""
+    try:
+        server = AnalysisServer(socket_path)
+    except FileExistsError as e:
+        print(f"Error: {e}.")
+        return
+    try:
+        warm_up()
+        print(f"🔥 Ready, listening on {socket_path}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def request_analysis(text: str, socket_path: str = DAEMON_SOCKET,
+                     known_words_dir: str = KNOWN_WORDS_DIR, output_format: str = 'text'):
+    """Send text to a running server and return its report, or its record for 'ndjson'"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            raise ConnectionError(f"No server listening on {socket_path}; start one with --serve") from None
+        request = {'text': text, 'known_words_dir': known_words_dir, 'format': output_format}
+        sock.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            response = json.loads(f.readline())
+    if 'error' in response:
+        error = f"Error: {response['error']}"
+        return {'error': error} if output_format == 'ndjson' else error
+    return response['record'] if output_format == 'ndjson' else response['report']
+
+
+def server_listening(socket_path: str = DAEMON_SOCKET) -> bool:
+    """Whether a server accepts connections on `socket_path`"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
+
+
+def analyze_texts(texts: List[str], ner_options: NerOptions = DEFAULT_NER_OPTIONS,
+                  cache: Optional[ResultCache] = None,
+                  vocabulary: Optional[Vocabulary] = None,
+                  profiles: Optional[List[StageProfile]] = None,
+                  cleaned_texts: Optional[List[Optional[str]]] = None) -> List[Tuple[Optional[AnalysisResult], Optional[bool]]]:
+    """Analyze several texts, reusing whatever the cache holds for them.
+    
+    Complete results are served from the cache when the text, word lists and
+    models are unchanged. Otherwise cached NER entities and pkuseg splits are
+    reused and only the DP and stats are recomputed; NER for texts without
+    cached entities runs through a single nlp.pipe stream.
+    
+    Texts are scored against `vocabulary`, or the word lists in known/ and
+    unknown/ if not given. If `profiles` holds a StageProfile per text, the
+    stages run for each text are recorded in it; the batched NER stream is
+    shared out by text length. If `cleaned_texts` holds a slot per text, the
+    cleaned text of each one that was analyzed (not served from the cache)
+    is stored there for reuse, e.g. by LibraryIndex.record.
+    
+    Returns (analysis, cached) per text. `analysis` is the exception raised
+    if the text could not be analyzed; `cached` is None if the cache was not
+    consulted.
+    """
+    outcomes: List = [None] * len(texts)
+    cached: List[Optional[bool]] = [None] * len(texts)
+    
+    fingerprint = None
+    if cache is not None:
+        try:
+            fingerprint = analysis_fingerprint(vocabulary or load_vocabulary(), ner_options)
+        except FileNotFoundError:
+            pass  # Each text reports the missing directory below
+    
+    if profiles is None:
+        profiles = [None] * len(texts)
+    
+    result_keys: List[Optional[str]] = [None] * len(texts)
+    if fingerprint:
+        for i, text in enumerate(texts):
+            with profiling(profiles[i]), profile_stage('cache'):
+                result_keys[i] = ResultCache.key(text, fingerprint)
+                outcomes[i] = cache.get(result_keys[i])
+            cached[i] = outcomes[i] is not None
+            if cached[i]:
+                # Counters describe work done by this analysis, and a hit does none
+                outcomes[i] = outcomes[i]._replace(counters={name: 0 for name in SEGMENTER_COUNTERS})
+    
+    missing = [i for i, outcome in enumerate(outcomes) if outcome is None]
+    cleaned = {}
+    for i in missing:
+        with profiling(profiles[i]), profile_stage('clean'):
+            cleaned[i] = clean_text(texts[i])
+        if cleaned_texts is not None:
+            cleaned_texts[i] = cleaned[i]
+    
+    # Proper nouns: cached per text, the rest in one NER stream
+    entity_keys: Dict[int, str] = {}
+    proper_nouns: Dict[int, Set[str]] = {}
+    if fingerprint:
+        entities_fingerprint = ner_fingerprint(ner_options)
+        for i in missing:
+            entity_keys[i] = ResultCache.key(cleaned[i], entities_fingerprint)
+            found = cache.get_entities(entity_keys[i])
+            if found is not None:
+                proper_nouns[i] = found
+    need_ner = [i for i in missing if i not in proper_nouns]
+    ner_failed: Set[int] = set()
+    batch_profile = StageProfile()
+    found_entities = []
+    if need_ner:
+        with profiling(batch_profile):
+            found_entities = detect_proper_nouns((cleaned[i] for i in need_ner), ner_options)
+    for i, found in zip(need_ner, found_entities):
+        if found is None:
+            # Analyzed without proper noun exclusion, so neither result is cached
+            proper_nouns[i] = set()
+            ner_failed.add(i)
+            continue
+        proper_nouns[i] = found
+        if fingerprint:
+            cache.put_entities(entity_keys[i], found)
+    ner_chars = sum(len(cleaned[i]) for i in need_ner)
+    for i in need_ner:
+        if profiles[i] is not None and ner_chars:
+            profiles[i].merge(batch_profile.share(len(cleaned[i]) / ner_chars))
+    
+    splits_fingerprint = segmenter_fingerprint() if fingerprint else None
+    for i in missing:
+        splits, splits_key = None, None
+        if fingerprint:
+            splits_key = ResultCache.key(cleaned[i], splits_fingerprint)
+            splits = cache.get_splits(splits_key) or {}
+        known_splits = len(splits) if splits is not None else 0
+        
+        try:
+            with profiling(profiles[i]):
+                outcomes[i] = analyze_text(texts[i], proper_nouns=proper_nouns[i], splits=splits,
+                                           vocabulary=vocabulary, cleaned=cleaned[i])
+        except Exception as e:
+            outcomes[i] = e
+            continue
+        
+        if fingerprint:
+            with profiling(profiles[i]):
+                # Stored with the result so reports from the cache never load pypinyin
+                outcomes[i] = outcomes[i]._replace(
+                    pinyin={word: tone_pinyin(word) for word, _ in outcomes[i].unknown_words})
+            with profiling(profiles[i]), profile_stage('cache'):
+                if i not in ner_failed:
+                    cache.put(result_keys[i], outcomes[i])
+                if len(splits) != known_splits:
+                    cache.put_splits(splits_key, splits)
+    
+    return list(zip(outcomes, cached))
+
+
+def print_progress(analyzer: StreamingAnalyzer) -> None:
+    """Print running figures for a stream to stderr, keeping stdout for the report"""
+    try:
+        result = analyzer.result()
+    except ValueError:
+        return  # No Chinese words committed yet
+    print(f"⏳ {analyzer.chars:,} chars, {result.total_words:,} words, "
+          f"{result.comprehension_pct:.1f}% known", file=sys.stderr, flush=True)
+
+
+def stream_source(source: str, ner_options: NerOptions = DEFAULT_NER_OPTIONS,
+                  progress: bool = True, output_format: str = 'text', profile: bool = False) -> None:
+    """Analyze UTF-8 text from stdin ('-'), a named pipe or a file as it arrives"""
+    if profile:
+        tracemalloc.start()
+    raw = sys.stdin.buffer if source == '-' else open(source, 'rb')
+    analyzer = StreamingAnalyzer(ner_options=ner_options)
+    last_progress = time.monotonic()
+    try:
+        for chunk in iter_text_chunks(PipeReader(raw)):
+            analyzer.feed(chunk)
+            if progress and time.monotonic() - last_progress >= STREAM_PROGRESS_INTERVAL:
+                print_progress(analyzer)
+                last_progress = time.monotonic()
+    finally:
+        if raw is not sys.stdin.buffer:
+            raw.close()
+    
+    print(finished_block(analyzer, source, output_format))
+    if profile:
+        tracemalloc.stop()
+        print_profile(analyzer.profile, 1, file=sys.stderr)
+
+
+def file_header(txt_file: str) -> str:
+    return f"\n{'='*60}\nFile: {txt_file}\n{'='*60}"
+
+
+def ndjson_line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False)
+
+
+def finished_block(analyzer: StreamingAnalyzer, name: str, output_format: str = 'text') -> str:
+    """Final report of a stream, or its record as an NDJSON line"""
+    try:
+        analysis = analyzer.finish()
+        if output_format == 'ndjson':
+            return ndjson_line({'file': name, 'cached': None, **analysis_record(analysis, analyzer.profile)})
+        with profiling(analyzer.profile):
+            return format_report(analysis)
+    except Exception as e:
+        if output_format == 'ndjson':
+            return ndjson_line({'file': name, 'cached': None, 'error': error_report(e)})
+        return error_report(e)
+
+
+def analyze_large_file(file_path: str, ner_options: NerOptions = DEFAULT_NER_OPTIONS,
+                       output_format: str = 'text') -> FileReport:
+    """Analyze a file in streaming chunks so memory stays bounded by the chunk size"""
+    analyzer = StreamingAnalyzer(ner_options=ner_options)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for chunk in iter_text_chunks(f):
+            analyzer.feed(chunk)
+    txt_file = os.path.basename(file_path)
+    block = finished_block(analyzer, txt_file, output_format)
+    if output_format != 'ndjson':
+        block = f"{file_header(txt_file)}\n{block}"
+    return FileReport(block, analyzer.chars, None, analyzer.profile)
+
+
+def analyze_files(file_paths: List[str], socket_path: Optional[str] = None,
+                  ner_options: NerOptions = DEFAULT_NER_OPTIONS,
+                  cache: Optional[ResultCache] = None,
+                  library: Optional[LibraryIndex] = None,
+                  output_format: str = 'text') -> List[FileReport]:
+    """Analyze a batch of input files.
+    
+    Returns a FileReport for each file, in order, so callers can print
+    results and report throughput. See analyze_texts for how the cache is
+    used. Successfully analyzed files are recorded in `library` if given.
+    With output_format 'ndjson' each block is one JSON record instead of a
+    text report.
+    """
+    ndjson = output_format == 'ndjson'
+    
+    results: List[Optional[FileReport]] = [None] * len(file_paths)
+    pending = []
+    
+    for idx, file_path in enumerate(file_paths):
+        txt_file = os.path.basename(file_path)
+        try:
+            if os.path.getsize(file_path) > STREAM_THRESHOLD_BYTES and not socket_path:
+                # Too large to hold in memory: analyzed in chunks, without the cache
+                results[idx] = analyze_large_file(file_path, ner_options, output_format)
+                continue
+            profile = StageProfile()
+            with profiling(profile), profile_stage('read'):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+        except Exception as e:
+            logger.error(f"Error processing '{txt_file}': {e}")
+            block = (ndjson_line({'file': txt_file, 'cached': None, 'error': error_report(e)}) if ndjson
+                     else f"\n[{txt_file}] - ERROR: {e}")
+            results[idx] = FileReport(block, 0, None, None)
+            continue
+        
+        if not text.strip():
+            logger.warning(f"File '{txt_file}' is empty, skipping")
+            block = (ndjson_line({'file': txt_file, 'cached': None, 'skipped': 'empty file'}) if ndjson
+                     else f"\n[{txt_file}] - SKIPPED (empty file)")
+            results[idx] = FileReport(block, len(text), None, None)
+            continue
+        
+        pending.append((idx, txt_file, text, profile))
+    
+    cleaned_texts: List[Optional[str]] = [None] * len(pending)
+    if socket_path:
+        outcomes = []
+        for _, _, text, _ in pending:
+            try:
+                outcomes.append((request_analysis(text, socket_path, output_format=output_format), None))
+            except ConnectionError as e:
+                outcomes.append((e, None))  # The server went away mid-run
+    else:
+        outcomes = analyze_texts([text for _, _, text, _ in pending], ner_options, cache,
+                                 profiles=[profile for _, _, _, profile in pending],
+                                 cleaned_texts=cleaned_texts)
+    
+    analyzed = []
+    for (idx, txt_file, text, profile), cleaned, (outcome, hit) in zip(pending, cleaned_texts, outcomes):
+        if isinstance(outcome, (str, dict)):
+            report = outcome  # Already formatted by the server
+            profile = None
+        elif isinstance(outcome, Exception):
+            report = {'error': error_report(outcome)} if ndjson else error_report(outcome)
+        else:
+            try:
+                if ndjson:
+                    report = analysis_record(outcome, profile)
+                else:
+                    with profiling(profile):
+                        report = format_report(outcome)
+            except Exception as e:
+                report = {'error': error_report(e)} if ndjson else error_report(e)
+            analyzed.append((file_paths[idx], text, outcome, cleaned))
+        
+        if ndjson:
+            block = ndjson_line({'file': txt_file, 'cached': hit, **report})
+        else:
+            block = f"{file_header(txt_file)}\n{report}"
+        results[idx] = FileReport(block, len(text), hit, profile)
+    
+    if library is not None and analyzed:
+        library.record(analyzed, load_vocabulary())
+    
+    return results
+
+
+def process_input_files(input_dir: str = INPUT_DIR, socket_path: Optional[str] = None,
+                        jobs: int = 1, ner_options: NerOptions = DEFAULT_NER_OPTIONS,
+                        cache: Optional[ResultCache] = None,
+                        library: Optional[LibraryIndex] = None,
+                        output_format: str = 'text', profile: bool = False) -> None:
+    """Process all txt files in the input directory and generate reports.
+    
+    Args:
+        input_dir: Directory containing input text files to analyze
+        socket_path: If given, send texts to the warm server listening there
+            instead of analyzing them in this process
+        jobs: Number of worker processes. Each worker loads the segmenter, NER
+            model and dictionaries once; reports are still printed in file order
+        ner_options: NER batching settings. Up to batch_size files are read and
+            streamed through NER together (fewer when needed to spread files
+            over all jobs); n_process only applies without jobs
+        cache: Result cache that unchanged files are served from; hit/miss
+            counts are printed at the end and the cache's limits applied
+        library: Index that analyzed files are recorded in for later re-scoring
+        output_format: 'text' for reports, or 'ndjson' for one JSON record per
+            file on stdout, with progress and summary lines moved to stderr
+        profile: Trace memory allocations and print a per-stage summary table
+            of time, calls and allocated bytes over all files
+    """
+    # Keep stdout machine-readable in ndjson mode
+    info = sys.stderr if output_format == 'ndjson' else sys.stdout
+    
+    if not os.path.exists(input_dir):
         logger.error(f"Input directory not found: '{input_dir}'")
-        print(f"Error: Input directory '{input_dir}' does not exist.")
-        print(f"Please create the directory and add .txt files to analyze.")
+        print(f"Error: Input directory '{input_dir}' does not exist.", file=info)
+        print(f"Please create the directory and add .txt files to analyze.", file=info)
         return
     
     if not os.path.isdir(input_dir):
         logger.error(f"'{input_dir}' is not a directory")
-        print(f"Error: '{input_dir}' is not a directory.")
+        print(f"Error: '{input_dir}' is not a directory.", file=info)
         return
     
     # Get all txt files in the input directory
-    txt_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+    txt_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.txt'))
     
     if not txt_files:
         logger.warning(f"No .txt files found in '{input_dir}'")
-        print(f"No .txt files found in '{input_dir}' directory.")
-        print(f"Please add .txt files containing Chinese text to analyze.")
+        print(f"No .txt files found in '{input_dir}' directory.", file=info)
+        print(f"Please add .txt files containing Chinese text to analyze.", file=info)
+        return
+    
+    if socket_path and not server_listening(socket_path):
+        logger.error(f"No server listening on '{socket_path}'")
+        print(f"Error: No server listening on {socket_path}; start one with --serve.", file=info)
         return
     
-    print(f"📊 Processing {len(txt_files)} file(s)...\n")
+    print(f"📊 Processing {len(txt_files)} file(s)...\n", file=info)
     
-    # Process each file
-    for txt_file in txt_files:
-        file_path = os.path.join(input_dir, txt_file)
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            
-            if not text.strip():
-                logger.warning(f"File '{txt_file}' is empty, skipping")
-                print(f"\n[{txt_file}] - SKIPPED (empty file)")
-                continue
-            
-            # Generate report
-            print(f"\n{'='*60}")
-            print(f"File: {txt_file}")
-            print('='*60)
-            result = comprehension_checker(text)
-            print(result)
-            
-        except Exception as e:
-            logger.error(f"Error processing '{txt_file}': {e}")
-            print(f"\n[{txt_file}] - ERROR: {e}")
+    file_paths = [os.path.join(input_dir, txt_file) for txt_file in txt_files]
+    batch_size = ner_options.batch_size
+    if jobs > 1:
+        # Smaller batches when there are too few files to give every worker a full one
+        batch_size = min(batch_size, -(-len(file_paths) // jobs))
+    batches = [file_paths[i:i + batch_size] for i in range(0, len(file_paths), batch_size)]
+    start = time.perf_counter()
+    total_chars = 0
+    hits = misses = 0
+    total_profile = StageProfile()
+    if profile:
+        tracemalloc.start()
+    
+    def report_batches():
+        if jobs > 1:
+            # Warm workers once each; map() yields results in submission order
+            # nlp.pipe must not spawn its own processes inside a worker
+            worker_options = ner_options._replace(n_process=1)
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                     initargs=(not socket_path, profile)) as executor:
+                yield from executor.map(analyze_files, batches, [socket_path] * len(batches),
+                                        [worker_options] * len(batches), [cache] * len(batches),
+                                        [library] * len(batches), [output_format] * len(batches))
+        else:
+            for batch in batches:
+                yield analyze_files(batch, socket_path, ner_options, cache, library, output_format)
+    
+    for results in report_batches():
+        for report in results:
+            print(report.block)
+            total_chars += report.chars
+            if report.cached is not None:
+                hits += report.cached
+                misses += not report.cached
+            if report.profile is not None:
+                total_profile.merge(report.profile)
+    
+    if jobs > 1:
+        elapsed = time.perf_counter() - start
+        print(f"\n⏱️  {len(file_paths)} file(s), {total_chars} chars in {elapsed:.2f}s "
+              f"({len(file_paths) / elapsed:.1f} files/sec, {total_chars / elapsed:.0f} chars/sec)", file=info)
+    
+    if cache is not None and hits + misses:
+        cache.evict()
+        print(f"\n💾 Cache: {hits} hit(s), {misses} miss(es)", file=info)
+    
+    if profile:
+        tracemalloc.stop()
+        print_profile(total_profile, len(file_paths), file=info)
+
+
+def format_bytes(n: int) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if abs(n) < 1024:
+            return f"{n:.0f}{unit}" if unit == 'B' else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def print_profile(profile: StageProfile, files: int, file=None) -> None:
+    """Print time, calls and allocated bytes per stage, slowest first"""
+    print(f"\n⏱️  Stage profile over {files} file(s) (nested stages overlap)", file=file)
+    print(f"{'stage':<12}{'calls':>8}{'seconds':>11}{'ms/call':>10}{'allocated':>12}", file=file)
+    for stage, stats in sorted(profile.stages.items(), key=lambda item: item[1].seconds, reverse=True):
+        print(f"{stage:<12}{stats.calls:>8}{stats.seconds:>11.4f}"
+              f"{stats.seconds / stats.calls * 1000:>10.3f}{format_bytes(stats.bytes):>12}", file=file)
+
+
+def print_ranking(library: LibraryIndex) -> None:
+    """Print every indexed document, most comprehensible first"""
+    for path, analysis in library.ranking():
+        print(f"{analysis.comprehension_pct:5.1f}%  {analysis.assessment:<20} {path}")
+
+
+def print_recommendations(library: LibraryIndex, known_words_dir: str, top_k: int) -> None:
+    """Print the indexed texts best suited to the learner's known words"""
+    known_words = load_vocabulary(known_words_dir).known_words
+    for path, pct in load_ranking_index(library).recommend(known_words, top_k):
+        print(f"{pct:5.1f}%  {get_assessment(pct):<20} {path}")
+
+
+def print_learner_table(input_dir: str, learners_dir: str, ner_options: NerOptions,
+                        cache: Optional[ResultCache]) -> None:
+    """Print a tab-separated learners x documents comprehension table"""
+    learners, paths, matrix = score_learners(input_dir, learners_dir, ner_options, cache)
+    print('\t'.join(['learner'] + [os.path.basename(path) for path in paths]))
+    for learner, row in zip(learners, matrix):
+        print('\t'.join([learner] + [f"{pct:.1f}" for pct in row]))
+
+
+def startup_trace(argv: List[str]) -> int:
+    """Run this command again under `python -X importtime` and summarize import cost.
+    
+    Imports made at the top level of the run, whether at startup or deferred
+    until a code path needed them, are totalled per package and printed to
+    stderr, most expensive first, with the total run time.
+    """
+    import subprocess
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), *argv],
+                          stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    
+    packages: Counter = Counter()
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m is None:
+            if not line.startswith('import time:'):
+                print(line, file=sys.stderr)
+        elif not m.group(3):
+            # Nested imports are already part of their top-level import's cumulative time
+            packages[m.group(4).split('.')[0]] += int(m.group(2))
+    
+    print(f"\n🚀 Startup trace: {elapsed * 1000:.0f}ms total, "
+          f"{sum(packages.values()) / 1000:.0f}ms importing", file=sys.stderr)
+    for package, micros in packages.most_common(STARTUP_TRACE_TOP):
+        print(f"{micros / 1000:>9.1f}ms  {package}", file=sys.stderr)
+    return proc.returncode
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analyze Chinese text comprehension against known words.")
+    parser.add_argument('--compile-cedict', action='store_true',
+                        help="build the binary CC-CEDICT index and exit")
+    parser.add_argument('--build-snapshot', action='store_true',
+                        help=f"bake the models and CC-CEDICT index into {SNAPSHOT_PATH} and exit")
+    parser.add_argument('--startup-trace', action='store_true',
+                        help="run the command and report how long importing each module took")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--serve', action='store_true',
+                      help="run a warm server that keeps models and dictionaries loaded")
+    mode.add_argument('--client', action='store_true',
+                      help="send input files to a running server instead of analyzing locally")
+    mode.add_argument('--rescore', action='store_true',
+                      help="re-score indexed documents affected by word list changes and print the ranking")
+    mode.add_argument('--recommend', type=int, metavar='K',
+                      help="print the K indexed texts closest to the Optimal (i+1) band")
+    mode.add_argument('--learners', metavar='DIR',
+                      help="score input files for every learner (one known words directory per "
+                           "subdirectory of DIR) and print a learners x documents table")
+    mode.add_argument('--stream', metavar='SOURCE',
+                      help="analyze UTF-8 text from SOURCE ('-' for stdin, or a named pipe) as it "
+                           "arrives, printing running figures to stderr")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='text', dest='output_format',
+                        help="'text' reports, or 'ndjson' for one JSON record per file (default: text)")
+    parser.add_argument('--profile', action='store_true',
+                        help="print time, calls and allocated bytes per analysis stage (slower: traces allocations)")
+    parser.add_argument('--no-progress', action='store_true',
+                        help="with --stream, only print the final report")
+    parser.add_argument('--known', default=KNOWN_WORDS_DIR,
+                        help=f"known words directory of the learner for --recommend (default: {KNOWN_WORDS_DIR})")
+    parser.add_argument('--socket', default=DAEMON_SOCKET,
+                        help=f"Unix socket for --serve/--client (default: {DAEMON_SOCKET})")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="analyze files in N worker processes and report throughput")
+    parser.add_argument('--ner-batch-size', type=int, default=NER_BATCH_SIZE,
+                        help=f"texts streamed through spaCy NER per batch (default: {NER_BATCH_SIZE})")
+    parser.add_argument('--ner-processes', type=int, default=NER_N_PROCESS,
+                        help="processes used by spaCy's nlp.pipe when not using --jobs")
+    parser.add_argument('--ner-chunk-chars', type=int, default=NER_MAX_CHUNK_CHARS,
+                        help=f"longest sentence-bounded chunk passed to spaCy (default: {NER_MAX_CHUNK_CHARS})")
+    parser.add_argument('--cache', default=CACHE_PATH,
+                        help=f"result cache database (default: {CACHE_PATH})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="analyze every file from scratch without reading or writing the cache")
+    parser.add_argument('--library', default=LIBRARY_PATH,
+                        help=f"index of analyzed documents used by --rescore (default: {LIBRARY_PATH})")
+    parser.add_argument('--no-library', action='store_true',
+                        help="do not record analyzed files in the library index")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    if args.startup_trace:
+        argv = sys.argv[1:] if argv is None else argv
+        sys.exit(startup_trace([arg for arg in argv if arg != '--startup-trace']))
+    if args.build_snapshot:
+        # Image build step: later runs deserialize the models instead of loading them
+        print(f"Built {build_snapshot()}")
+    elif args.compile_cedict:
+        # Offline step: build the binary index so later runs only need to mmap it
+        print(f"Compiled {compile_cedict(CEDICT_PATH)}")
+    elif args.serve:
+        serve(args.socket)
+    else:
+        ner_options = NerOptions(args.ner_batch_size, args.ner_processes, args.ner_chunk_chars)
+        cache = None if args.no_cache else ResultCache(args.cache)
+        if cache is not None and not cache.available():
+            cache = None  # e.g. a read-only checkout: analyze without caching
+        if args.stream:
+            stream_source(args.stream, ner_options, progress=not args.no_progress,
+                          output_format=args.output_format, profile=args.profile)
+        elif args.learners:
+            print_learner_table(INPUT_DIR, args.learners, ner_options, cache)
+        elif args.recommend is not None or args.rescore:
+            library = LibraryIndex(args.library)
+            if not library.available():
+                print(f"Error: Library index '{args.library}' cannot be opened.")
+            elif args.rescore:
+                rescored, total = rescore_library(library, ner_options, cache)
+                print(f"♻️  Re-scored {rescored} of {total} indexed document(s)\n")
+                print_ranking(library)
+            else:
+                print_recommendations(library, args.known, args.recommend)
+        else:
+            library = None if args.no_library or args.client else LibraryIndex(args.library)
+            if library is not None and not library.available():
+                library = None  # Files are analyzed as usual, just not recorded
+            process_input_files(socket_path=args.socket if args.client else None, jobs=args.jobs,
+                                ner_options=ner_options, cache=cache, library=library,
+                                output_format=args.output_format, profile=args.profile)
 
 
 if __name__ == "__main__":
-    process_input_files()
+    main()